@@ -0,0 +1,67 @@
+# bench_machine_store.py
+"""
+Compare the per-dict loop (temperature check, then the rule engine for the
+S1/S2 counts) with MachineStore's vectorized masks at 1k / 10k / 100k machines.
+
+    python bench_machine_store.py [--repeat N]
+"""
+import argparse, random, time
+import numpy as np
+from server.graph.machine_store import MachineStore, UPSET_EVENT_TYPE
+from server.rule_engine import RULES
+from server.config import MACHINE_UPSET_TEMPERATURE
+
+
+def make_machines(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    return [{"id": f"M{i}", "status": rnd.choice(["running", "stopped"]),
+             "temperature": round(rnd.uniform(40, 130), 1),
+             "vibration": round(rnd.uniform(0.1, 1.6), 2)} for i in range(n)]
+
+
+def dict_scan(machines):
+    # The shop floor loop's threshold, then the machine_upset rules, record by record
+    upset, s1, s2 = [], 0, 0
+    for m in machines:
+        if m.get("temperature", 0) > MACHINE_UPSET_TEMPERATURE:
+            upset.append(m)
+        severity = RULES.triage({"type": UPSET_EVENT_TYPE, "payload": m})["severity"]
+        s1 += severity == "S1"
+        s2 += severity == "S2"
+    return upset, s1, s2
+
+
+def store_scan(store: MachineStore):
+    store.mark_all_dirty()
+    upset = store.scan_upsets()
+    return upset, int(np.count_nonzero(store.s1_mask())), int(np.count_nonzero(store.s2_mask()))
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    print(f"{'machines':>9} {'dict scan':>11} {'store scan':>11} {'masks only':>11}")
+    for n in (1_000, 10_000, 100_000):
+        machines = make_machines(n)
+        store = MachineStore()
+        store.upsert(machines)
+        a, b = dict_scan(machines), store_scan(store)
+        assert (len(a[0]), a[1], a[2]) == (len(b[0]), b[1], b[2]), "store and dict scan disagree"
+        t_dict = best_of(lambda: dict_scan(machines), args.repeat)
+        t_store = best_of(lambda: store_scan(store), args.repeat)
+        t_masks = best_of(lambda: (store.upset_mask(), store.s1_mask(), store.s2_mask()), args.repeat)
+        print(f"{n:>9} {t_dict * 1e3:>9.2f}ms {t_store * 1e3:>9.2f}ms {t_masks * 1e3:>9.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
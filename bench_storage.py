@@ -0,0 +1,105 @@
+# bench_storage.py
+"""
+Compare the JSON and SQLite storage backends on scratch copies: action log
+append throughput (until durable), filtered log query latency, single
+record writes to a safety-log dataset and a cold dataset load.
+
+    python bench_storage.py [--entries N] [--records N] [--writes N]
+"""
+import argparse, random, shutil, tempfile, time, os
+from datetime import datetime, timedelta
+from server.repository import Dataset
+from server.storage.json_backend import JsonBackend
+from server.storage.sqlite_backend import SQLiteBackend, SQLiteLog
+from server.tools.action_log import SegmentedLog
+
+ACTIONS = ["notify", "stop_machine", "schedule_maintenance", "update_order_schedule", "escalate"]
+
+
+def make_entries(n: int, seed: int = 3):
+    rnd = random.Random(seed)
+    t0 = datetime(2025, 1, 1)
+    return [{"timestamp": (t0 + timedelta(seconds=i)).isoformat(), "actor": "tool",
+             "action": rnd.choice(ACTIONS), "target": f"M{rnd.randrange(200)}",
+             "level": rnd.choice(["info", "warning", "critical"]), "detail": "x" * 40} for i in range(n)]
+
+
+def make_logs(n: int, seed: int = 5):
+    rnd = random.Random(seed)
+    return [{"id": f"S{i}", "status": rnd.choice(["open", "resolved"]), "severity": rnd.choice(["low", "high"]),
+             "description": "guard rail missing near line 4"} for i in range(n)]
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def bench_log(log, entries, repeat: int):
+    t = time.perf_counter()
+    for e in entries:
+        log.append(e)
+    log.flush()
+    appends = len(entries) / (time.perf_counter() - t)
+    since = entries[len(entries) // 2]["timestamp"]
+    queries = {
+        "latest 50": lambda: log.query(limit=50),
+        "action=escalate": lambda: log.query(limit=50, action="escalate"),
+        "target+level": lambda: log.query(limit=50, target="M7", level="critical"),
+        "deep page": lambda: log.query(limit=50, before=len(entries) // 10),
+        "since+action": lambda: log.query(limit=50, since=since, action="notify"),
+    }
+    return appends, {name: best_of(fn, repeat) for name, fn in queries.items()}
+
+
+def bench_dataset(backend, records, writes: int):
+    Dataset("safety_logs", "id", backend=backend).replace_all(records)
+    t = time.perf_counter()
+    ds = Dataset("safety_logs", "id", {"status": lambda r: r.get("status")}, backend=backend)
+    ds.sync()
+    load = time.perf_counter() - t
+    ids = [r["id"] for r in records]
+    rnd = random.Random(9)
+    t = time.perf_counter()
+    for _ in range(writes):
+        ds.update(rnd.choice(ids), {"status": rnd.choice(["open", "resolved"])})
+    return writes / (time.perf_counter() - t), load
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--entries", type=int, default=50_000)
+    ap.add_argument("--records", type=int, default=5_000)
+    ap.add_argument("--writes", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    entries, records = make_entries(args.entries), make_logs(args.records)
+    root = tempfile.mkdtemp(prefix="bench_storage_")
+    try:
+        json_dir, db = os.path.join(root, "json"), os.path.join(root, "bench.db")
+        os.makedirs(json_dir)
+        logs = {"json": SegmentedLog(os.path.join(json_dir, "action_log")), "sqlite": SQLiteLog(db)}
+        backends = {"json": JsonBackend(json_dir), "sqlite": SQLiteBackend(db)}
+        results = {}
+        for name in ("json", "sqlite"):
+            appends, queries = bench_log(logs[name], entries, args.repeat)
+            logs[name].close()
+            writes, load = bench_dataset(backends[name], records, args.writes)
+            results[name] = (appends, queries, writes, load)
+        print(f"{args.entries} log entries, {args.records} safety-log records, {args.writes} single-record writes")
+        print(f"{'':<24} {'json':>12} {'sqlite':>12}")
+        print(f"{'log appends (durable)':<24} " + " ".join(f"{results[n][0]:>10.0f}/s" for n in results))
+        for q in results["json"][1]:
+            print(f"{'query ' + q:<24} " + " ".join(f"{results[n][1][q] * 1e3:>10.3f}ms" for n in results))
+        print(f"{'record writes':<24} " + " ".join(f"{results[n][2]:>10.0f}/s" for n in results))
+        print(f"{'cold dataset load':<24} " + " ".join(f"{results[n][3] * 1e3:>10.2f}ms" for n in results))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
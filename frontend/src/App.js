@@ -1,5 +1,5 @@
 import React, {useEffect, useState} from "react";
-import { fetchMachines, fetchOrders, fetchLogs, fetchSafetyLogs, publishEvent, connectStream } from "./api";
+import { publishEvent, connectStream, followState, requestResync, applyDelta, resolveSafetyLogs } from "./api";
 import MachinesPanel from "./components/MachinesPanel";
 import OrdersPanel from "./components/OrdersPanel";
 import SafetyLogsPanel from "./components/SafetyLogsPanel";
@@ -12,19 +12,49 @@ export default function App(){
   const [safety, setSafety] = useState([]);
   const [workflows, setWorkflows] = useState([]);
 
-  async function loadAll(){
-    setMachines(await fetchMachines());
-    setOrders(await fetchOrders());
-    setLogs(await fetchLogs());
-    setSafety(await fetchSafetyLogs());
-  }
-
   useEffect(()=>{
-    // Initial load and periodic refresh for machines/orders/safety
-    loadAll();
-    const id=setInterval(loadAll, 5000);
-    // Live log + triage feed via WebSocket
-    const ws = connectStream((msg)=>{
+    // State arrives over the WebSocket: one snapshot, then record-level deltas (no polling)
+    const collections = {
+      machines: [setMachines, 'id'],
+      orders: [setOrders, 'order_id'],
+      safety_logs: [setSafety, 'id'],
+    };
+    let seq = null;
+    let ws = null;
+    let retry = null;
+    let closed = false;
+
+    function onMessage(msg){
+      if(msg?.type === 'state_snapshot'){
+        seq = msg.seq;
+        const d = msg.data || {};
+        setMachines(d.machines || []);
+        setOrders(d.orders || []);
+        setSafety(d.safety_logs || []);
+        setLogs(d.logs || []);
+        return;
+      }
+      if(msg?.type === 'state_delta'){
+        if(seq === null || msg.seq <= seq) return;
+        if(msg.seq !== seq + 1){
+          // Missed a delta (e.g. dropped as a slow consumer): start over from a snapshot
+          seq = null;
+          requestResync(ws);
+          return;
+        }
+        seq = msg.seq;
+        const target = collections[msg.data?.collection];
+        if(target){
+          const [setter, key] = target;
+          setter(prev => applyDelta(prev, msg.data, key));
+        }
+        return;
+      }
+      if(msg?.type === 'closed'){
+        seq = null;
+        if(!closed) retry = setTimeout(connect, 3000);
+        return;
+      }
       if(msg?.type === 'log'){
         setLogs(prev => [msg.data, ...prev].slice(0, 500));
       }
@@ -38,15 +68,26 @@ export default function App(){
           setSafety(prev => prev.map(it => it.id === id ? {...it, status: 'resolved'} : it));
         }
       }
-    });
-    return ()=>{ clearInterval(id); try{ ws && ws.close(); }catch(_){} };
+    }
+
+    function connect(){
+      ws = connectStream(onMessage);
+      followState(ws);
+    }
+
+    connect();
+    return ()=>{ closed = true; clearTimeout(retry); try{ ws && ws.close(); }catch(_){} };
   },[]);
 
   async function onResolve(log){
     // publish a manual resolve event
     await publishEvent({source:"UI","type":"safety_resolve","payload": {"id":log.id}});
     alert("Resolve event published.");
-    loadAll();
+  }
+
+  async function onResolveMany(ids){
+    const res = await resolveSafetyLogs(ids);
+    alert(`${res.resolved ?? 0} of ${ids.length} safety logs resolved.`);
   }
 
   return (
@@ -56,7 +97,7 @@ export default function App(){
         <MachinesPanel machines={machines}/>
         <OrdersPanel orders={orders}/>
         <WorkflowPanel workflows={workflows}/>
-        <SafetyLogsPanel logs={safety} onResolve={onResolve}/>
+        <SafetyLogsPanel logs={safety} onResolve={onResolve} onResolveMany={onResolveMany}/>
       </div>
     </div>
   );
@@ -18,13 +18,57 @@ export async function publishEvent(event) {
   return r.json();
 }
 
+// Resolve several safety logs in one request (one write-back on the server)
+export async function resolveSafetyLogs(ids) {
+  const r = await fetch(`${BASE}/safety_logs/resolve`, { method: "POST", headers: {"Content-Type":"application/json"}, body: JSON.stringify({ids}) });
+  return r.json();
+}
+
 export function connectStream(onMessage) {
   const ws = new WebSocket(WS_URL);
+  ws.addEventListener("close", () => onMessage && onMessage({type: "closed"}));
   ws.onmessage = (evt) => {
     try {
       const msg = JSON.parse(evt.data);
-      onMessage && onMessage(msg);
+      // The server coalesces messages from one tick into {type: "batch", data: [...]}
+      const msgs = msg?.type === 'batch' ? msg.data : [msg];
+      msgs.forEach(m => onMessage && onMessage(m));
     } catch (_) {}
   };
   return ws;
 }
+
+function send(ws, msg) {
+  const text = JSON.stringify(msg);
+  if (ws.readyState === WebSocket.OPEN) ws.send(text);
+  else ws.addEventListener("open", () => ws.send(text), {once: true});
+}
+
+// Narrow what this socket receives, e.g. {types: ['triage'], machine_ids: ['M1'], severities: ['S1']}.
+// Also accepts order_ids, safety_ids and categories; call with {} to receive everything again.
+export function subscribe(ws, filters) {
+  send(ws, filters && Object.keys(filters).length ? {type: "subscribe", ...filters} : {type: "unsubscribe"});
+}
+
+// Ask for the state stream: one state_snapshot, then state_delta messages with consecutive seq numbers
+export function followState(ws) {
+  send(ws, {type: "state_subscribe"});
+}
+
+export function requestResync(ws) {
+  send(ws, {type: "state_resync"});
+}
+
+// Apply a state_delta's upserts/removed to a record list keyed by `key`, keeping existing order
+export function applyDelta(records, delta, key) {
+  const removed = new Set((delta.removed || []).map(String));
+  const upserts = new Map((delta.upserts || []).map(r => [String(r[key]), r]));
+  const next = [];
+  for (const r of records) {
+    const k = String(r[key]);
+    if (removed.has(k)) continue;
+    if (upserts.has(k)) { next.push(upserts.get(k)); upserts.delete(k); }
+    else next.push(r);
+  }
+  return next.concat([...upserts.values()]);
+}
@@ -1,13 +1,32 @@
-import React from "react";
-export default function SafetyLogsPanel({logs, onResolve}) {
+import React, {useState} from "react";
+export default function SafetyLogsPanel({logs, onResolve, onResolveMany}) {
+  const [selected, setSelected] = useState(new Set());
+  // Only ids that are still unresolved count towards the bulk action
+  const pending = logs.filter(l => l.status==="unresolved" && selected.has(l.id)).map(l => l.id);
+
+  function toggle(id){
+    setSelected(prev => {
+      const next = new Set(prev);
+      next.has(id) ? next.delete(id) : next.add(id);
+      return next;
+    });
+  }
+
+  async function resolveSelected(){
+    await onResolveMany(pending);
+    setSelected(new Set());
+  }
+
   return (
     <div className="panel">
       <h3>Safety Logs</h3>
+      {onResolveMany && <button disabled={!pending.length} onClick={resolveSelected}>Resolve selected ({pending.length})</button>}
       <table>
-        <thead><tr><th>ID</th><th>Event</th><th>Location</th><th>Operator</th><th>Status</th><th>Details</th><th>Action</th></tr></thead>
+        <thead><tr><th></th><th>ID</th><th>Event</th><th>Location</th><th>Operator</th><th>Status</th><th>Details</th><th>Action</th></tr></thead>
         <tbody>
           {logs.map(l => (
             <tr key={l.id} className={l.status==="unresolved" ? "critical": ""}>
+              <td>{l.status==="unresolved" && <input type="checkbox" checked={selected.has(l.id)} onChange={() => toggle(l.id)}/>}</td>
               <td>{l.id}</td>
               <td>{l.event_type}</td>
               <td>{l.location}</td>
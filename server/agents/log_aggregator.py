@@ -0,0 +1,182 @@
+# server/agents/log_aggregator.py
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from server.tools.action_log import ACTION_LOG
+
+DEFAULT_HORIZON_MINUTES = 24 * 60
+
+
+def _parse_ts(entry: Dict[str, Any]) -> Optional[float]:
+    # Naive timestamps are UTC, as in the SupervisorAgent's original parser
+    try:
+        dt = datetime.fromisoformat(entry.get("timestamp", ""))
+        dt = dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    except Exception:
+        return None
+
+
+def _delayed_order_id(entry: Dict[str, Any]) -> Optional[str]:
+    evt = entry.get("event") or {}
+    if isinstance(evt, dict) and evt.get("type") == "order_delay":
+        return evt.get("payload", {}).get("order_id")
+    return None
+
+
+class _Bucket:
+    __slots__ = ("minute", "items", "by_action", "notifies", "delays")
+
+    def __init__(self, minute: int):
+        self.minute = minute
+        self.items: List[tuple] = []            # (ts, action) in arrival order
+        self.by_action: Counter = Counter()
+        self.notifies: List[tuple] = []         # (ts, entry)
+        self.delays: List[tuple] = []           # (ts, order_id)
+
+
+class RollingAggregator:
+    """
+    Minute-bucketed rolling view of the action log for the SupervisorAgent.
+    Fed incrementally by the log's append listener (after a one-off backfill
+    of the horizon), so hourly and daily summaries cost O(buckets) instead of
+    re-reading and re-parsing the whole log. Whole buckets inside the window
+    use their counters; only the bucket straddling the cutoff is scanned
+    per entry, which keeps results identical to the full-scan version.
+    """
+    def __init__(self, log=ACTION_LOG, horizon_minutes: int = DEFAULT_HORIZON_MINUTES):
+        self.log = log
+        self.horizon_minutes = horizon_minutes
+        self.buckets: deque = deque()
+        self._lock = threading.Lock()
+        self._started = False
+        self._early: Optional[List[Dict[str, Any]]] = None
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            # Entries appended during the backfill are held back so buckets fill in order
+            self._early = []
+        last_seq = self.log.add_listener(self._on_append)
+        since = datetime.fromtimestamp(time.time() - self.horizon_minutes * 60, timezone.utc).isoformat()
+        backfill: List[Dict[str, Any]] = []
+        before = last_seq + 1
+        while True:
+            page, before = self.log.query(limit=1000, before=before, since=since)
+            backfill.extend(page)
+            if before is None:
+                break
+        with self._lock:
+            for entry in reversed(backfill):
+                self._add_locked(entry)
+            for entry in self._early:
+                self._add_locked(entry)
+            self._early = None
+
+    def _on_append(self, _seq: int, entry: Dict[str, Any]):
+        with self._lock:
+            if self._early is not None:
+                self._early.append(entry)
+            else:
+                self._add_locked(entry)
+
+    def _bucket_for(self, minute: int) -> Optional[_Bucket]:
+        # Entries arrive almost in time order; search from the newest end
+        if not self.buckets or minute > self.buckets[-1].minute:
+            b = _Bucket(minute)
+            self.buckets.append(b)
+            return b
+        for i in range(len(self.buckets) - 1, -1, -1):
+            b = self.buckets[i]
+            if b.minute == minute:
+                return b
+            if b.minute < minute:
+                nb = _Bucket(minute)
+                self.buckets.insert(i + 1, nb)
+                return nb
+        if minute >= self._floor_minute():
+            nb = _Bucket(minute)
+            self.buckets.appendleft(nb)
+            return nb
+        return None
+
+    def _floor_minute(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        return int(now // 60) - self.horizon_minutes - 1
+
+    def _evict(self, now: Optional[float] = None):
+        floor = self._floor_minute(now)
+        while self.buckets and self.buckets[0].minute < floor:
+            self.buckets.popleft()
+
+    def add(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._add_locked(entry)
+
+    def _add_locked(self, entry: Dict[str, Any]):
+        ts = _parse_ts(entry)
+        if ts is None:
+            return
+        b = self._bucket_for(int(ts // 60))
+        if b is None:
+            return
+        action = entry.get("action")
+        b.items.append((ts, action))
+        b.by_action[action] += 1
+        if action == "notify":
+            b.notifies.append((ts, entry))
+        oid = _delayed_order_id(entry)
+        if oid:
+            b.delays.append((ts, oid))
+        self._evict()
+
+    def _window(self, minutes: int, now: Optional[float]):
+        now = time.time() if now is None else now
+        cutoff = now - minutes * 60
+        return cutoff, int(cutoff // 60)
+
+    def summarize(self, minutes: int = 60, now: Optional[float] = None) -> Dict[str, Any]:
+        cutoff, cutoff_minute = self._window(minutes, now)
+        summary: Dict[str, Any] = {
+            "window_minutes": minutes,
+            "total_actions": 0,
+            "by_action": {},
+            "notifies": [],
+        }
+        by_action: Counter = Counter()
+        with self._lock:
+            self._evict(now)
+            # Newest first, matching the order of the full-log scan
+            for b in reversed(self.buckets):
+                if b.minute < cutoff_minute:
+                    break
+                if b.minute > cutoff_minute:
+                    by_action.update(b.by_action)
+                    summary["total_actions"] += len(b.items)
+                    summary["notifies"].extend(e for ts, e in reversed(b.notifies))
+                    continue
+                for ts, action in b.items:
+                    if ts >= cutoff:
+                        by_action[action] += 1
+                        summary["total_actions"] += 1
+                summary["notifies"].extend(e for ts, e in reversed(b.notifies) if ts >= cutoff)
+        summary["by_action"] = dict(by_action)
+        return summary
+
+    def recent_order_delays(self, minutes: int = 60, now: Optional[float] = None) -> List[str]:
+        cutoff, cutoff_minute = self._window(minutes, now)
+        order_ids: List[str] = []
+        with self._lock:
+            self._evict(now)
+            for b in reversed(self.buckets):
+                if b.minute < cutoff_minute:
+                    break
+                order_ids.extend(oid for ts, oid in reversed(b.delays) if ts >= cutoff)
+        return list(dict.fromkeys(order_ids))
+
+
+AGGREGATOR = RollingAggregator()
@@ -1,39 +1,48 @@
 import asyncio
-import json
-import os
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, List
 from server.tools.production_tools import log_event
 from server.tools.notify_tools import notify
-from server.config import DATA_DIR
 from server.tools.production_tools import update_order_schedule
+from server.tools.action_log import read_logs
+from server.agents.log_aggregator import AGGREGATOR
+from server.storage import get_backend
+from server.metrics import LOOP_SCAN_SECONDS
 
-LOG_FILE = os.path.join(DATA_DIR, "action_log.json")
-STATE_FILE = os.path.join(DATA_DIR, "supervisor_state.json")
+# supervisor_state.json under the JSON backend
+STATE_NAME = "supervisor_state"
 
 
 def _read_logs(limit: int | None = None):
-    if not os.path.exists(LOG_FILE):
-        return []
     try:
-        logs = json.load(open(LOG_FILE))
-        return logs if limit is None else logs[:limit]
+        return read_logs(limit)
     except Exception:
         return []
 
 
 def summarize_last_period(minutes: int = 60) -> Dict[str, Any]:
+    if minutes <= AGGREGATOR.horizon_minutes:
+        AGGREGATOR.start()
+        return AGGREGATOR.summarize(minutes)
+    return _scan_last_period(minutes)
+
+
+def _parse_ts(e):
+    try:
+        ts = e.get("timestamp", "")
+        # Ensure naive timestamps are treated as UTC
+        dt = datetime.fromisoformat(ts)
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+
+def _scan_last_period(minutes: int) -> Dict[str, Any]:
+    # Full-log scan, only for windows longer than the aggregator's horizon
     logs = _read_logs()
     cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    def parse_ts(e):
-        try:
-            ts = e.get("timestamp", "")
-            # Ensure naive timestamps are treated as UTC
-            dt = datetime.fromisoformat(ts)
-            return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
-        except Exception:
-            return None
-    recent = [e for e in logs if (ts := parse_ts(e)) and ts >= cutoff]
+    recent = [e for e in logs if (ts := _parse_ts(e)) and ts >= cutoff]
 
     summary: Dict[str, Any] = {
         "window_minutes": minutes,
@@ -52,49 +61,24 @@ def summarize_last_period(minutes: int = 60) -> Dict[str, Any]:
 
 
 def _load_state() -> Dict[str, Any]:
-    if os.path.exists(STATE_FILE):
-        try:
-            return json.load(open(STATE_FILE))
-        except Exception:
-            return {}
-    return {}
+    return get_backend().load_state(STATE_NAME)
 
 
 def _save_state(state: Dict[str, Any]):
     try:
-        json.dump(state, open(STATE_FILE, "w"), indent=2)
+        get_backend().save_state(STATE_NAME, state)
     except Exception:
         pass
 
 
 def _collect_recent_order_delays(minutes: int = 60) -> List[str]:
-    logs = _read_logs()
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    order_ids: List[str] = []
-    def parse_ts(e):
-        try:
-            dt = datetime.fromisoformat(e.get("timestamp", ""))
-            return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
-        except Exception:
-            return None
-    for e in logs:
-        ts = parse_ts(e)
-        if not ts or ts < cutoff:
-            continue
-        # triage log entries carry the event payload
-        evt = e.get("event") or {}
-        tri = e.get("triage") or {}
-        if isinstance(evt, dict) and evt.get("type") == "order_delay":
-            payload = evt.get("payload", {})
-            oid = payload.get("order_id")
-            if oid:
-                order_ids.append(oid)
-        # Also consider executed tool logs for update_order
-    return list(dict.fromkeys(order_ids))
+    AGGREGATOR.start()
+    return AGGREGATOR.recent_order_delays(minutes)
 
 
 async def loop(interval_seconds: int = 60):
     while True:
+        started = time.perf_counter()
         try:
             summary = summarize_last_period(minutes=60)
             log_event({"agent": "SupervisorAgent", "summary": summary})
@@ -106,8 +90,10 @@ async def loop(interval_seconds: int = 60):
             # Replan schedules: if multiple order delays recently, push due times by +2 hours
             delayed_orders = _collect_recent_order_delays(minutes=60)
             for oid in delayed_orders:
-                update_order_schedule(oid, new_due_in_hours=2)
-                notify("planner", f"Order {oid} auto-rescheduled by SupervisorAgent", "info")
+                res = update_order_schedule(oid, new_due_in_hours=2)
+                # Already rescheduled within the action-state window: nothing new to tell the planner
+                if not res.get("already_applied"):
+                    notify("planner", f"Order {oid} auto-rescheduled by SupervisorAgent", "info")
 
             # Daily summary once per day
             st = _load_state()
@@ -121,4 +107,5 @@ async def loop(interval_seconds: int = 60):
                 _save_state(st)
         except Exception as e:
             log_event({"agent": "SupervisorAgent", "error": str(e)})
+        LOOP_SCAN_SECONDS.observe(time.perf_counter() - started, "supervisor")
         await asyncio.sleep(interval_seconds)
@@ -7,6 +7,7 @@ from langchain.schema import SystemMessage
 from server.llm import get_triage_llm
 from server import tools
 from server.agents.safety_log_agent import mark_resolved
+from server.rule_engine import RULES
 from typing import Dict, Any, List
 
 # ---------------------------------------------------------
@@ -104,64 +105,9 @@ TRIAGE_EXECUTOR = build_triage_executor()
 # Fallback logic (if GPT fails)
 # ---------------------------------------------------------
 async def fallback_classification(event: Dict[str, Any]):
-    etype = event.get("type")
-    out = {
-        "severity": "S4",
-        "category": "Unknown",
-        "recommended_actions": ["log"],
-        "tools_to_call": [],
-        "rationale": "Default fallback"
-    }
-
-    if etype == "machine_overheat":
-        temp = event.get("temperature", 0)
-        if temp >= 120:
-            out = {
-                "severity": "S1",
-                "category": "Machine",
-                "recommended_actions": ["stop_machine", "schedule_maintenance", "notify"],
-                "tools_to_call": [
-                    {"name": "stop_machine", "args": {"machine_id": event["machine_id"]}},
-                    {"name": "schedule_maintenance", "args": {"machine_id": event["machine_id"]}},
-                    {"name": "notify",
-                     "args": {"role": "supervisor", "message": "Critical overheat", "level": "critical"}}
-                ],
-                "rationale": f"Temp {temp} > 120°C"
-            }
-
-    elif etype == "order_delay":
-        dp = event.get("delay_percent", 0)
-        if dp >= 50:
-            out = {
-                "severity": "S2",
-                "category": "Order",
-                "recommended_actions": ["update_order", "notify"],
-                "tools_to_call": [
-                    {"name": "update_order", "args": {"order_id": event["order_id"], "new_due_in_hours": 3}},
-                    {"name": "notify",
-                     "args": {"role": "planner", "message": "Order delayed heavily", "level": "warning"}}
-                ],
-                "rationale": f"Delay {dp}%"
-            }
-
-    elif etype in ("ppe_missing", "unsafe_zone_entry"):
-        out = {
-            "severity": "S1",
-            "category": "Safety",
-            "recommended_actions": ["notify", "log"],
-            "tools_to_call": [
-                {
-                    "name": "notify",
-                    "args": {
-                        "role": "supervisor",
-                        "message": f"Safety violation: {etype}",
-                        "level": "critical"
-                    }
-                }
-            ],
-            "rationale": "Critical safety violation"
-        }
-
+    # Same compiled rule table as the MockLLM path
+    out = RULES.triage(event)
+    out["recommended_actions"] = [t["name"] for t in out["tools_to_call"]] or ["log"]
     return out
 
 
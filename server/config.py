@@ -11,3 +11,83 @@ USE_OPENAI_TRIAGE = os.getenv("USE_OPENAI_TRIAGE", "0").strip() in ("1", "true",
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 LOG_FILE = os.path.join(DATA_DIR, "action_log.json")
+
+# Append-only action log: line-delimited segments under LOG_DIR (LOG_FILE is the legacy import source)
+LOG_DIR = os.path.join(DATA_DIR, "action_log")
+LOG_SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(8 * 1024 * 1024)))
+LOG_TAIL_SIZE = int(os.getenv("LOG_TAIL_SIZE", "500"))
+# Group commit: entries arriving within the window share one write + fsync
+LOG_COMMIT_WINDOW_MS = float(os.getenv("LOG_COMMIT_WINDOW_MS", "5"))
+LOG_COMMIT_MAX_BATCH = int(os.getenv("LOG_COMMIT_MAX_BATCH", "1000"))
+# Longest a full-log read waits for the writer before serving queued entries from memory
+LOG_READ_FLUSH_TIMEOUT_SECONDS = float(os.getenv("LOG_READ_FLUSH_TIMEOUT_SECONDS", "2"))
+# SQLite log: failed commits of a batch retried this many times before its rows are written one
+# by one and any row that still fails is dropped (logged as an error)
+LOG_WRITE_MAX_RETRIES = int(os.getenv("LOG_WRITE_MAX_RETRIES", "5"))
+# /logs paging: max page size, and the cap applied to the legacy unparameterized call
+LOGS_PAGE_MAX = int(os.getenv("LOGS_PAGE_MAX", "1000"))
+LOGS_UNPAGED_CAP = int(os.getenv("LOGS_UNPAGED_CAP", "500"))
+# Agent data feeds re-evaluate every record once per resync period even if nothing changed (0 = never)
+FEED_RESYNC_SECONDS = float(os.getenv("FEED_RESYNC_SECONDS", "60"))
+# Shop floor loop: a machine whose temperature is strictly above this raises machine_upset
+MACHINE_UPSET_TEMPERATURE = float(os.getenv("MACHINE_UPSET_TEMPERATURE", "100"))
+# Router queue: merge pending events per (type, entity id); suppress repeats of a processed event within the window
+EVENT_COALESCE = os.getenv("EVENT_COALESCE", "1").strip() in ("1", "true", "True")
+EVENT_DEDUP_WINDOW_SECONDS = float(os.getenv("EVENT_DEDUP_WINDOW_SECONDS", "0"))
+# Concurrent router workers; events for the same entity are still processed one at a time, in order
+ROUTER_WORKERS = int(os.getenv("ROUTER_WORKERS", "4"))
+# Priority lanes (see graph/event_queue.classify_lane) and their weighted-fair dequeue shares
+EVENT_LANE_WEIGHTS = os.getenv("EVENT_LANE_WEIGHTS", "critical:8,high:4,normal:1")
+# Bounded router queue (0 = unbounded). Policy when full: block | drop_oldest | reject (HTTP 429)
+EVENT_QUEUE_MAX_DEPTH = int(os.getenv("EVENT_QUEUE_MAX_DEPTH", "10000"))
+EVENT_QUEUE_POLICY = os.getenv("EVENT_QUEUE_POLICY", "block").strip()
+# Log one in every N shed events (the first is always logged)
+EVENT_SHED_LOG_EVERY = int(os.getenv("EVENT_SHED_LOG_EVERY", "100"))
+# Async OpenAI triage: optional base URL (e.g. a local stub), concurrency, timeout, retries, circuit breaker
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+TRIAGE_MAX_IN_FLIGHT = int(os.getenv("TRIAGE_MAX_IN_FLIGHT", "8"))
+TRIAGE_TIMEOUT_SECONDS = float(os.getenv("TRIAGE_TIMEOUT_SECONDS", "15"))
+TRIAGE_RETRIES = int(os.getenv("TRIAGE_RETRIES", "2"))
+TRIAGE_BACKOFF_SECONDS = float(os.getenv("TRIAGE_BACKOFF_SECONDS", "0.5"))
+TRIAGE_BREAKER_THRESHOLD = int(os.getenv("TRIAGE_BREAKER_THRESHOLD", "5"))
+TRIAGE_BREAKER_COOLDOWN_SECONDS = float(os.getenv("TRIAGE_BREAKER_COOLDOWN_SECONDS", "30"))
+# Triage decision cache (model path only): LRU size (0 disables), TTL, optional warm-start file, numeric buckets
+TRIAGE_CACHE_SIZE = int(os.getenv("TRIAGE_CACHE_SIZE", "1024"))
+TRIAGE_CACHE_TTL_SECONDS = float(os.getenv("TRIAGE_CACHE_TTL_SECONDS", "300"))
+TRIAGE_CACHE_FILE = os.getenv("TRIAGE_CACHE_FILE", "")
+TRIAGE_CACHE_BUCKETS = os.getenv("TRIAGE_CACHE_BUCKETS", "temperature:5,vibration:0.1,delay_percent:10")
+# Micro-batched model triage: up to N events per request (1 = off), waiting at most T ms to fill a batch.
+# Under backlog the worker that starts a batch drains up to N waiting events from the router queue.
+TRIAGE_BATCH_SIZE = int(os.getenv("TRIAGE_BATCH_SIZE", "1"))
+TRIAGE_BATCH_WAIT_MS = float(os.getenv("TRIAGE_BATCH_WAIT_MS", "20"))
+# Declarative triage rules (hot-reloaded when the file changes)
+RULES_FILE = os.getenv("RULES_FILE", os.path.join(os.path.dirname(__file__), "rules", "triage_rules.json"))
+RULES_RELOAD_CHECK_SECONDS = float(os.getenv("RULES_RELOAD_CHECK_SECONDS", "2"))
+# Bulk ingestion (POST /publish_events): events validated and enqueued per chunk, and a per-request cap
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))
+INGEST_MAX_EVENTS = int(os.getenv("INGEST_MAX_EVENTS", "100000"))
+# Largest accepted request body in bytes (0 = unlimited); larger bodies get 413
+INGEST_MAX_BODY_BYTES = int(os.getenv("INGEST_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+# WebSocket fan-out: per-client outbound queue (frames), policy when it is full (drop_oldest | disconnect), send timeout
+WS_SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE_MAX", "256"))
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest").strip()
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+# Dashboard state stream over /ws: how often the data files are checked for record-level deltas
+STATE_STREAM_INTERVAL_SECONDS = float(os.getenv("STATE_STREAM_INTERVAL_SECONDS", "1"))
+# Storage for datasets, the action log and agent state: json (files under DATA_DIR) | sqlite (one WAL database at SQLITE_PATH)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "shopfloor.db"))
+# Safety-log resolutions are applied in memory and written back in batches: every N seconds, or once M are pending
+SAFETY_RESOLVE_FLUSH_SECONDS = float(os.getenv("SAFETY_RESOLVE_FLUSH_SECONDS", "2"))
+SAFETY_RESOLVE_BATCH_MAX = int(os.getenv("SAFETY_RESOLVE_BATCH_MAX", "500"))
+# Tool execution (async tools and sync tools marked offload): default timeout and concurrency per tool,
+# with per-tool overrides as "name:value,..." (e.g. TOOL_TIMEOUTS="stop_machine:5,notify:2")
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+TOOL_TIMEOUTS = os.getenv("TOOL_TIMEOUTS", "")
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "8"))
+TOOL_CONCURRENCY = os.getenv("TOOL_CONCURRENCY", "")
+# Idempotent tools: a repeat of the same action on the same target within the window returns "already applied"
+# without running the tool (0 disables); per-tool overrides as "name:seconds,..."; max (tool, target) entries
+ACTION_STATE_TTL_SECONDS = float(os.getenv("ACTION_STATE_TTL_SECONDS", "300"))
+ACTION_STATE_TTLS = os.getenv("ACTION_STATE_TTLS", "")
+ACTION_STATE_MAX_ENTRIES = int(os.getenv("ACTION_STATE_MAX_ENTRIES", "10000"))
@@ -1,62 +1,83 @@
 # server/graph/agents_loops.py
-import asyncio, json, os
+import asyncio, time
 from server.graph.engine import GLOBAL_GRAPH
-from server.tools.production_tools import log_event
+from server.graph.machine_store import MACHINE_STORE, UPSET_EVENT_TYPE
+from server.repository import MACHINES, ORDERS, SAFETY_LOGS, DatasetFeed
+from server.tools.production_tools import log_event, machine_status_changed
+from server.tools import safety_store
+from server.metrics import LOOP_SCAN_SECONDS
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-MACHINES_FILE = os.path.join(DATA_DIR, "machines.json")
-ORDERS_FILE = os.path.join(DATA_DIR, "orders.json")
-SAFETY_FILE = os.path.join(DATA_DIR, "safety_logs.json")
+# Each loop only sees records that changed since its last scan (plus a periodic full resync)
+MACHINES_FEED = DatasetFeed(MACHINES)
+ORDERS_FEED = DatasetFeed(ORDERS)
+SAFETY_FEED = DatasetFeed(SAFETY_LOGS)
 
 async def shopfloor_loop(interval=8):
     while True:
+        started = time.perf_counter()
         try:
-            with open(MACHINES_FILE) as f:
-                machines = json.load(f)
-            for m in machines:
-                if m.get("temperature",0) > 100:
-                    # Use a generic 'machine_upset' event consumed by triage
-                    event = {"source":"ShopFloorAgent","type":"machine_upset","payload": m}
-                    log_event({"agent":"ShopFloorAgent","event": event})
-                    await GLOBAL_GRAPH.publish(event)
+            changes = MACHINES_FEED.poll()
+            MACHINE_STORE.remove(changes.removed)
+            for m in changes.upserts:
+                # A restart drops the cached stop / maintenance before the machine is rescanned
+                machine_status_changed(m.get("id"), MACHINE_STORE.status_of(m.get("id")), m.get("status"))
+            MACHINE_STORE.upsert(changes.upserts)
+            # One vectorized temperature mask over the rows that changed
+            for m in MACHINE_STORE.scan_upsets():
+                # Use a generic 'machine_upset' event consumed by triage
+                event = {"source":"ShopFloorAgent","type":UPSET_EVENT_TYPE,"payload": m}
+                log_event({"agent":"ShopFloorAgent","event": event})
+                await GLOBAL_GRAPH.publish(event)
         except Exception as e:
             log_event({"actor":"ShopFloorAgent","error":str(e)})
+        LOOP_SCAN_SECONDS.observe(time.perf_counter() - started, "shopfloor")
         await asyncio.sleep(interval)
 
 async def order_loop(interval=10):
     while True:
-        with open(ORDERS_FILE) as f:
-            orders = json.load(f)
-        for o in orders:
-            due = o.get("due_in_hours", 999)
-            progress = o.get("progress", 0)
-            if due <= 1 and progress < 80:
-                dp = max(0, 100 - progress)
-                event = {
-                    "source": "OrderAgent",
-                    "type": "order_delay",
-                    "payload": {
-                        "order_id": o.get("order_id"),
-                        "progress": progress,
-                        "due_in_hours": due,
-                        "delay_percent": dp,
-                    },
-                }
-                log_event({"agent": "OrderAgent", "event": event})
-                await GLOBAL_GRAPH.publish(event)
+        started = time.perf_counter()
+        try:
+            for o in ORDERS_FEED.poll().upserts:
+                due = o.get("due_in_hours", 999)
+                progress = o.get("progress", 0)
+                if due <= 1 and progress < 80:
+                    dp = max(0, 100 - progress)
+                    event = {
+                        "source": "OrderAgent",
+                        "type": "order_delay",
+                        "payload": {
+                            "order_id": o.get("order_id"),
+                            "progress": progress,
+                            "due_in_hours": due,
+                            "delay_percent": dp,
+                        },
+                    }
+                    log_event({"agent": "OrderAgent", "event": event})
+                    await GLOBAL_GRAPH.publish(event)
+        except Exception as e:
+            # e.g. QueueFull under the "reject" policy; keep the loop alive
+            log_event({"actor":"OrderAgent","error":str(e)})
+        LOOP_SCAN_SECONDS.observe(time.perf_counter() - started, "order")
         await asyncio.sleep(interval)
 
 async def safety_log_loop(interval=6):
     while True:
+        started = time.perf_counter()
         try:
-            with open(SAFETY_FILE) as f:
-                logs = json.load(f)
-            for lg in logs:
-                if lg.get("status") == "unresolved":
+            for lg in SAFETY_FEED.poll().upserts:
+                # Skip logs whose event is still queued or in progress (released once processed)
+                if lg.get("status") == "unresolved" and safety_store.claim(lg.get("id")):
                     event = {"source":"SafetyAgent","type": lg.get("event_type"), "payload": lg}
                     log_event({"agent":"SafetyAgent","event":event})
                     # Publish only; engine will resolve dynamically after triage
-                    await GLOBAL_GRAPH.publish(event)
+                    try:
+                        queued = await GLOBAL_GRAPH.publish(event)
+                    except Exception:
+                        safety_store.release(lg.get("id"))
+                        raise
+                    if not queued:
+                        safety_store.release(lg.get("id"))
         except Exception as e:
             log_event({"actor":"SafetyAgent","error":str(e)})
+        LOOP_SCAN_SECONDS.observe(time.perf_counter() - started, "safety")
         await asyncio.sleep(interval)
@@ -1,16 +1,35 @@
-import asyncio
+import asyncio, time
 from typing import Any, Dict, List
 from server.graph.state import Event, TriageOutput, MemoryState
-from server.graph.triage_graph import triage_run
+from server.graph.triage_graph import triage_run_async
+from server.llm import TRIAGE_CLIENT, TRIAGE_BATCHER, uses_openai
+from server.triage_cache import TRIAGE_CACHE
+from server.rule_engine import RULES
 from server.graph.event_router import route_and_execute
-from server.tools.production_tools import log_event
+from server.graph.tool_nodes import snapshot_tools
+from server.graph.event_queue import CoalescingQueue, classify_lane, parse_lane_weights
+from server.graph.machine_store import MACHINE_STORE
+from server.tools.production_tools import log_event, append_log
 from server.tools.safety_store import mark_resolved as mark_safety_resolved
-from server.realtime import notify_triage, notify_safety_resolved
+from server.tools import safety_store
+from server.tools.action_state import ACTION_STATE
+from server.realtime import MANAGER, notify_triage, notify_safety_resolved
+from server.metrics import REGISTRY, STAGE_SECONDS, EVENT_AGE_SECONDS
+from server.config import EVENT_COALESCE, EVENT_DEDUP_WINDOW_SECONDS, ROUTER_WORKERS, EVENT_LANE_WEIGHTS
+from server.config import EVENT_QUEUE_MAX_DEPTH, EVENT_QUEUE_POLICY, EVENT_SHED_LOG_EVERY
 
 
 class GlobalRouterGraph:
-    def __init__(self):
-        self.queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+    def __init__(self, workers: int = ROUTER_WORKERS):
+        self.workers = max(1, workers)
+        self.queue = CoalescingQueue(
+            coalesce=EVENT_COALESCE,
+            dedup_window=EVENT_DEDUP_WINDOW_SECONDS,
+            lane_weights=parse_lane_weights(EVENT_LANE_WEIGHTS),
+            max_depth=EVENT_QUEUE_MAX_DEPTH,
+            policy=EVENT_QUEUE_POLICY,
+            on_shed=self._on_shed,
+        )
         self.memory = MemoryState()
 
     def snapshot_memory(self) -> Dict[str, Any]:
@@ -19,10 +38,35 @@ class GlobalRouterGraph:
             "counts_by_category": dict(self.memory.counts_by_category),
             "counts_by_severity": dict(self.memory.counts_by_severity),
             "last_triage": self.memory.last_triage.dict() if self.memory.last_triage else None,
+            "queue": self.queue.snapshot(),
+            "triage_client": TRIAGE_CLIENT.snapshot(),
+            "triage_cache": TRIAGE_CACHE.snapshot(),
+            "rules": RULES.snapshot(),
+            "triage_batcher": TRIAGE_BATCHER.snapshot(),
+            "machines": MACHINE_STORE.snapshot(),
+            "realtime": MANAGER.snapshot(),
+            "safety": safety_store.snapshot(),
+            "tools": snapshot_tools(),
+            "action_state": ACTION_STATE.snapshot(),
         }
 
-    async def publish(self, event: Dict[str, Any]):
-        await self.queue.put(event)
+    def _on_shed(self, ev: Dict[str, Any], reason: str, total: int):
+        # A shed safety event frees its log for the next scan
+        log_id = safety_store.event_log_id(ev)
+        if log_id is not None:
+            safety_store.release(log_id)
+        # Sample shed events into the action log for capacity planning
+        if total == 1 or (EVENT_SHED_LOG_EVERY > 0 and total % EVENT_SHED_LOG_EVERY == 0):
+            append_log({"actor": "GlobalRouterGraph", "action": "event_shed", "reason": reason,
+                       "policy": self.queue.policy, "shed_total": total, "event": ev})
+
+    async def publish(self, event: Dict[str, Any]) -> bool:
+        # False when the event was suppressed as a duplicate or shed; raises QueueFull under "reject"
+        return await self.queue.put(event)
+
+    async def publish_many(self, events: List[Dict[str, Any]]) -> List[str]:
+        # One lock and one backpressure check for the whole batch; a status per event
+        return await self.queue.put_many(events)
 
     def _update_memory(self, triage: TriageOutput):
         self.memory.events_processed += 1
@@ -31,12 +75,23 @@ class GlobalRouterGraph:
         self.memory.last_triage = triage
 
     async def process_one(self, ev: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
         event = Event(**ev)
-        triage = triage_run(event)
+        t1 = time.perf_counter()
+        STAGE_SECONDS.observe(t1 - t0, "validation")
+        triage = await triage_run_async(event)
+        t2 = time.perf_counter()
+        STAGE_SECONDS.observe(t2 - t1, "triage")
         log_event({"agent": "TriageGraph", "event": ev, "triage": triage.dict()})
-        executed = route_and_execute(triage)
+        t3 = time.perf_counter()
+        executed = await route_and_execute(triage)
+        t4 = time.perf_counter()
+        STAGE_SECONDS.observe(t4 - t3, "route_and_execute")
         log_event({"agent": "TriageGraph", "executed": executed})
+        t5 = time.perf_counter()
+        STAGE_SECONDS.observe((t3 - t2) + (t5 - t4), "log_event")
         self._update_memory(triage)
+        self.queue.mark_processed(ev)
 
         # Dynamic safety resolution: resolve after processing SafetyAgent events or explicit safety_resolve events
         try:
@@ -47,37 +102,61 @@ class GlobalRouterGraph:
                     log_id = payload.get("id")
                     if mark_safety_resolved(log_id):
                         log_event({"agent": "TriageGraph", "action": "safety_resolved", "log_id": log_id})
-                        try:
-                            import asyncio
-                            loop = asyncio.get_running_loop()
-                            loop.create_task(notify_safety_resolved(log_id))
-                        except Exception:
-                            pass
+                        await notify_safety_resolved(log_id)
         except Exception:
             # Never block processing on resolution errors
             pass
+        t6 = time.perf_counter()
+        STAGE_SECONDS.observe(t6 - t5, "safety_resolution")
 
         result = {"event": ev, "triage": triage.dict(), "executed": executed}
         try:
-            # Fire-and-forget websocket notification
-            import asyncio
-            coro = notify_triage(result)
-            loop = asyncio.get_running_loop()
-            loop.create_task(coro)
+            # Non-blocking: queued for the next batched WebSocket frame
+            await notify_triage(result)
         except Exception:
             pass
+        STAGE_SECONDS.observe(time.perf_counter() - t6, "broadcast")
         return result
 
-    async def run_loop(self):
+    async def _handle(self, ev: Dict[str, Any]):
+        try:
+            await self.process_one(ev)
+        except Exception as e:
+            log_event({"actor": "GlobalRouterGraph", "error": str(e), "event": ev})
+        finally:
+            enqueued_at = self.queue.enqueued_at(ev)
+            if enqueued_at is not None:
+                EVENT_AGE_SECONDS.observe(time.monotonic() - enqueued_at, classify_lane(ev))
+            log_id = safety_store.event_log_id(ev)
+            if log_id is not None:
+                safety_store.release(log_id)
+            await self.queue.release(ev)
+            self.queue.task_done()
+
+    async def _worker(self):
         while True:
             ev = await self.queue.get()
-            try:
-                await self.process_one(ev)
-            except Exception as e:
-                log_event({"actor": "GlobalRouterGraph", "error": str(e), "event": ev})
-            finally:
-                self.queue.task_done()
+            if TRIAGE_BATCHER.max_batch > 1 and uses_openai():
+                # Backlog: take up to a full triage batch of other waiting events and
+                # process them together, so their model calls share one request
+                batch = [ev] + await self.queue.get_ready(TRIAGE_BATCHER.max_batch - 1)
+                await asyncio.gather(*(self._handle(e) for e in batch))
+            else:
+                await self._handle(ev)
+
+    async def run_loop(self):
+        # N workers share the queue; the queue keeps each entity on one worker at a time
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
 
 
 # Singleton instance
 GLOBAL_GRAPH = GlobalRouterGraph()
+
+REGISTRY.gauge("shopfloor_queue_depth", "Events waiting in the router queue, per priority lane",
+               lambda: {name: len(lane.items) for name, lane in GLOBAL_GRAPH.queue.lanes.items()}, ("lane",))
+REGISTRY.gauge("shopfloor_queue_in_flight_entities", "Entities with an event being processed",
+               lambda: GLOBAL_GRAPH.queue.in_flight())
+REGISTRY.counter("shopfloor_events_processed_total", "Events processed by the router",
+                 lambda: GLOBAL_GRAPH.memory.events_processed)
+REGISTRY.counter("shopfloor_events_shed_total", "Events shed by the bounded queue",
+                 lambda: {r: GLOBAL_GRAPH.queue.stats["shed_" + r] for r in ("dropped", "rejected")}, ("reason",))
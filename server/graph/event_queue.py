@@ -0,0 +1,433 @@
+# server/graph/event_queue.py
+import asyncio, heapq, itertools, json, time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+def _hashable(value: Any) -> Hashable:
+    # A list / dict id (or type) is keyed by its canonical JSON text, so it can never
+    # fail a dict or set lookup halfway through a batch
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return json.dumps(value, sort_keys=True, default=str)
+
+
+def entity_id(ev: Dict[str, Any]) -> Optional[Hashable]:
+    payload = ev.get("payload") if isinstance(ev.get("payload"), dict) else {}
+    for field in ("id", "machine_id", "order_id"):
+        if payload.get(field) is not None:
+            return _hashable(payload[field])
+    for field in ("machine_id", "order_id"):
+        if ev.get(field) is not None:
+            return _hashable(ev[field])
+    return None
+
+
+def coalesce_key(ev: Dict[str, Any]) -> Optional[Tuple[Any, Any]]:
+    # (type, entity id); None when the event names no entity and must not be merged
+    eid = entity_id(ev)
+    if eid is None:
+        return None
+    return (_hashable(ev.get("type")), eid)
+
+
+def _fingerprint(ev: Dict[str, Any]) -> str:
+    return json.dumps(ev.get("payload"), sort_keys=True, default=str)
+
+
+# Cheap pre-classification into priority lanes, by event type first, then source
+LANE_BY_TYPE = {
+    "ppe_missing": "critical",
+    "unsafe_zone_entry": "critical",
+    "ppe_violation": "critical",
+    "safety_resolve": "critical",
+    "machine_overheat": "high",
+    "machine_upset": "high",
+}
+LANE_BY_SOURCE = {"SafetyAgent": "critical", "ShopFloorAgent": "high"}
+DEFAULT_LANE = "normal"
+
+
+def classify_lane(ev: Dict[str, Any]) -> str:
+    return LANE_BY_TYPE.get(_hashable(ev.get("type"))) or LANE_BY_SOURCE.get(_hashable(ev.get("source"))) or DEFAULT_LANE
+
+
+def parse_lane_weights(spec: str) -> Dict[str, int]:
+    # "critical:8,high:4,normal:1" -> ordered {lane: weight}
+    weights: Dict[str, int] = {}
+    for part in spec.split(","):
+        name, _, w = part.strip().partition(":")
+        if name:
+            weights[name] = max(1, int(w or 1))
+    weights.setdefault(DEFAULT_LANE, 1)
+    return weights
+
+
+SHED_POLICIES = ("block", "drop_oldest", "reject")
+
+
+class QueueFull(Exception):
+    """Raised by put() under the "reject" policy when the queue is at max_depth."""
+
+
+class _Lane:
+    __slots__ = ("name", "weight", "items", "ready", "current", "dequeued", "wait_total", "wait_max")
+
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = weight
+        # slot key -> (event, first enqueue time, queue-wide sequence number)
+        self.items: "OrderedDict[Hashable, Tuple[Dict[str, Any], float, int]]" = OrderedDict()
+        # Heap of (seq, key) for the slots that may be handed out now; entries for
+        # slots that were shed or re-used since are skipped lazily
+        self.ready: List[Tuple[int, Hashable]] = []
+        self.current = 0
+        self.dequeued = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def head(self) -> Optional[Hashable]:
+        # Key of the oldest eligible slot, or None
+        while self.ready:
+            seq, key = self.ready[0]
+            slot = self.items.get(key)
+            if slot is not None and slot[2] == seq:
+                return key
+            heapq.heappop(self.ready)
+        return None
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        oldest = next(iter(self.items.values()), None)
+        return {
+            "weight": self.weight,
+            "depth": len(self.items),
+            "dequeued": self.dequeued,
+            "avg_wait_ms": round(1000 * self.wait_total / self.dequeued, 2) if self.dequeued else 0.0,
+            "max_wait_ms": round(1000 * self.wait_max, 2),
+            "oldest_age_ms": round(1000 * (now - oldest[1]), 2) if oldest else 0.0,
+        }
+
+
+class CoalescingQueue:
+    """
+    Drop-in for the router's asyncio.Queue. A pending event is replaced in
+    place by a newer one with the same (type, entity id), so a machine that
+    keeps being republished occupies a single slot. With dedup_window > 0 an
+    event identical to one processed for the same key within the window is
+    suppressed at publish time.
+
+    Several router workers can consume concurrently. Each entity keeps a FIFO
+    of its queued slots across all lanes, and only the head of that FIFO can
+    be handed out, once the entity is not being processed; release() frees
+    the entity and makes its next slot eligible. Events for one machine,
+    order or safety log therefore stay in order even when they classify into
+    different lanes, while unrelated ones run in parallel. A newer event only
+    coalesces into a slot that is still the entity's latest.
+
+    Events are split into priority lanes by classify_lane() and dequeued by
+    smooth weighted round-robin, so safety events jump ahead of a backlog of
+    order events without starving it.
+
+    With max_depth > 0 the queue is bounded. When full, "block" makes the
+    producer wait, "drop_oldest" sheds the oldest event of the lowest-priority
+    lane not above the incoming event's lane (or the incoming event itself),
+    and "reject" raises QueueFull. on_shed(ev, reason, total) is called for
+    every shed event.
+    """
+    def __init__(self, coalesce: bool = True, dedup_window: float = 0.0,
+                 lane_weights: Optional[Dict[str, int]] = None,
+                 max_depth: int = 0, policy: str = "block", on_shed=None):
+        if policy not in SHED_POLICIES:
+            raise ValueError(f"unknown queue policy: {policy}")
+        self.coalesce = coalesce
+        self.dedup_window = dedup_window
+        self.max_depth = max_depth
+        self.policy = policy
+        self.on_shed = on_shed
+        weights = lane_weights or {DEFAULT_LANE: 1}
+        self.lanes: Dict[str, _Lane] = {name: _Lane(name, w) for name, w in weights.items()}
+        self.lanes.setdefault(DEFAULT_LANE, _Lane(DEFAULT_LANE, 1))
+        # Lowest priority first, for choosing what to shed
+        self._shed_order = sorted(self.lanes.values(), key=lambda l: l.weight)
+        self._seq = itertools.count()
+        self._lock = asyncio.Lock()
+        self._not_empty = asyncio.Condition(self._lock)
+        self._not_full = asyncio.Condition(self._lock)
+        self._processed: Dict[Hashable, Tuple[float, str]] = {}
+        self._busy: set = set()
+        # entity id -> FIFO of its queued (lane, key, seq) slots, oldest first
+        self._entity_slots: Dict[Any, deque] = {}
+        # id(ev) -> first enqueue time of events handed out by get(), for end-to-end age
+        self._handed_out: Dict[int, float] = {}
+        self.stats = {"enqueued": 0, "coalesced": 0, "suppressed": 0,
+                      "blocked": 0, "shed_dropped": 0, "shed_rejected": 0}
+
+    def qsize(self) -> int:
+        return sum(len(lane.items) for lane in self.lanes.values())
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def in_flight(self) -> int:
+        # Entities with an event being processed
+        return len(self._busy)
+
+    def _lane_for(self, ev: Dict[str, Any]) -> _Lane:
+        return self.lanes.get(classify_lane(ev)) or self.lanes[DEFAULT_LANE]
+
+    def _is_duplicate(self, key: Hashable, ev: Dict[str, Any], now: float) -> bool:
+        seen = self._processed.get(key)
+        if seen is None:
+            return False
+        at, fp = seen
+        if now - at > self.dedup_window:
+            del self._processed[key]
+            return False
+        return fp == _fingerprint(ev)
+
+    def _full(self) -> bool:
+        return self.max_depth > 0 and self.qsize() >= self.max_depth
+
+    def _shed(self, ev: Dict[str, Any], reason: str):
+        self.stats["shed_" + reason] += 1
+        if self.on_shed is not None:
+            try:
+                self.on_shed(ev, reason, self.stats["shed_dropped"] + self.stats["shed_rejected"])
+            except Exception:
+                pass
+
+    def _make_ready(self, lane: _Lane, key: Hashable, seq: int):
+        heapq.heappush(lane.ready, (seq, key))
+
+    def _enqueue(self, lane: _Lane, key: Optional[Hashable], ev: Dict[str, Any], now: float):
+        # Caller holds the lock
+        seq = next(self._seq)
+        if key is None or key in lane.items:
+            key = ("#", seq)
+        lane.items[key] = (ev, now, seq)
+        eid = entity_id(ev)
+        if eid is None:
+            self._make_ready(lane, key, seq)
+            return
+        slots = self._entity_slots.setdefault(eid, deque())
+        slots.append((lane, key, seq))
+        if len(slots) == 1 and eid not in self._busy:
+            self._make_ready(lane, key, seq)
+
+    def _coalesce_into(self, lane: _Lane, key: Hashable, ev: Dict[str, Any]) -> bool:
+        # Replace a queued event in place, unless something for the entity is queued behind it
+        slot = lane.items.get(key)
+        if slot is None:
+            return False
+        last = self._entity_slots[key[1]][-1]
+        if last[0] is not lane or last[1] != key:
+            return False
+        # Keep the original enqueue time: the entity has been waiting since then
+        lane.items[key] = (ev, slot[1], slot[2])
+        self.stats["coalesced"] += 1
+        return True
+
+    def _forget(self, lane: _Lane, key: Hashable, slot: Tuple[Dict[str, Any], float, int]):
+        # A shed slot leaves its entity's FIFO; the next one may become eligible
+        eid = entity_id(slot[0])
+        if eid is None:
+            return
+        slots = self._entity_slots[eid]
+        was_head = slots[0][2] == slot[2]
+        slots.remove((lane, key, slot[2]))
+        if not slots:
+            del self._entity_slots[eid]
+        elif was_head and eid not in self._busy:
+            self._make_ready(*slots[0])
+
+    def _drop_oldest(self, incoming: _Lane) -> bool:
+        # Caller holds the lock; never sheds from a lane above the incoming event's
+        for lane in self._shed_order:
+            if lane.weight > incoming.weight:
+                break
+            if lane.items:
+                key, slot = lane.items.popitem(last=False)
+                self._forget(lane, key, slot)
+                self._shed(slot[0], "dropped")
+                return True
+        return False
+
+    async def put(self, ev: Dict[str, Any]) -> bool:
+        key = coalesce_key(ev) if self.coalesce else None
+        now = time.monotonic()
+        if key is not None and self.dedup_window > 0 and self._is_duplicate(key, ev, now):
+            self.stats["suppressed"] += 1
+            return False
+        lane = self._lane_for(ev)
+        async with self._lock:
+            while True:
+                if key is not None and self._coalesce_into(lane, key, ev):
+                    return True
+                if not self._full():
+                    break
+                if self.policy == "reject":
+                    self._shed(ev, "rejected")
+                    raise QueueFull(f"event queue full ({self.max_depth})")
+                if self.policy == "drop_oldest":
+                    if not self._drop_oldest(lane):
+                        self._shed(ev, "dropped")
+                        return False
+                    break
+                self.stats["blocked"] += 1
+                await self._not_full.wait()
+            self._enqueue(lane, key, ev, now)
+            self.stats["enqueued"] += 1
+            self._not_empty.notify()
+        return True
+
+    async def put_many(self, events: List[Dict[str, Any]]) -> List[str]:
+        """
+        Admit a batch under one lock acquisition and one capacity check,
+        applying the same dedup / coalesce / shed rules as put(). Returns a
+        status per event: enqueued, coalesced, suppressed, dropped or
+        rejected. Never raises QueueFull: under "reject" the overflow is
+        reported per event. Under "block" the batch waits for room as often
+        as needed, handing what already fits to the workers first.
+        """
+        now = time.monotonic()
+        results: List[str] = [""] * len(events)
+        staged = []
+        for i, ev in enumerate(events):
+            key = coalesce_key(ev) if self.coalesce else None
+            if key is not None and self.dedup_window > 0 and self._is_duplicate(key, ev, now):
+                self.stats["suppressed"] += 1
+                results[i] = "suppressed"
+                continue
+            staged.append((i, ev, key, self._lane_for(ev)))
+        async with self._lock:
+            free = self.max_depth - self.qsize() if self.max_depth > 0 else len(staged)
+            added = 0
+            pos = 0
+            while pos < len(staged):
+                i, ev, key, lane = staged[pos]
+                if key is not None and self._coalesce_into(lane, key, ev):
+                    results[i] = "coalesced"
+                    pos += 1
+                    continue
+                if free <= 0:
+                    if self.policy == "reject":
+                        self._shed(ev, "rejected")
+                        results[i] = "rejected"
+                        pos += 1
+                        continue
+                    if self.policy == "drop_oldest":
+                        if not self._drop_oldest(lane):
+                            self._shed(ev, "dropped")
+                            results[i] = "dropped"
+                            pos += 1
+                            continue
+                        free += 1
+                    else:
+                        self.stats["blocked"] += 1
+                        if added:
+                            self._not_empty.notify(added)
+                            added = 0
+                        await self._not_full.wait()
+                        free = self.max_depth - self.qsize()
+                        continue
+                self._enqueue(lane, key, ev, now)
+                self.stats["enqueued"] += 1
+                results[i] = "enqueued"
+                free -= 1
+                added += 1
+                pos += 1
+            if added:
+                self._not_empty.notify(added)
+        return results
+
+    def _pop_eligible(self) -> Optional[Dict[str, Any]]:
+        # Smooth weighted round-robin over the lanes that can hand out an event
+        ready = [lane for lane in self.lanes.values() if lane.head() is not None]
+        if not ready:
+            return None
+        total = 0
+        for lane in ready:
+            lane.current += lane.weight
+            total += lane.weight
+        lane = max(ready, key=lambda l: l.current)
+        lane.current -= total
+        key = lane.head()
+        heapq.heappop(lane.ready)
+        ev, enqueued_at, _ = lane.items.pop(key)
+        waited = time.monotonic() - enqueued_at
+        lane.dequeued += 1
+        lane.wait_total += waited
+        lane.wait_max = max(lane.wait_max, waited)
+        self._handed_out[id(ev)] = enqueued_at
+        eid = entity_id(ev)
+        if eid is not None:
+            slots = self._entity_slots[eid]
+            slots.popleft()
+            if not slots:
+                del self._entity_slots[eid]
+            self._busy.add(eid)
+        return ev
+
+    async def get(self) -> Dict[str, Any]:
+        # Caller must release(ev) once done with the returned event
+        async with self._lock:
+            while (ev := self._pop_eligible()) is None:
+                await self._not_empty.wait()
+            self._not_full.notify()
+            return ev
+
+    async def get_ready(self, limit: int) -> List[Dict[str, Any]]:
+        # Up to limit more events that are eligible right now, without waiting;
+        # each one must be released like an event from get()
+        out: List[Dict[str, Any]] = []
+        async with self._lock:
+            while len(out) < limit and (ev := self._pop_eligible()) is not None:
+                out.append(ev)
+            if out:
+                self._not_full.notify(len(out))
+        return out
+
+    async def release(self, ev: Dict[str, Any]):
+        eid = entity_id(ev)
+        if eid is None:
+            return
+        async with self._lock:
+            self._busy.discard(eid)
+            slots = self._entity_slots.get(eid)
+            if slots:
+                # The entity's next event (in whichever lane) is eligible now
+                self._make_ready(*slots[0])
+                self._not_empty.notify()
+
+    def enqueued_at(self, ev: Dict[str, Any]) -> Optional[float]:
+        # monotonic() time an event returned by get() was first enqueued; forgotten once read
+        return self._handed_out.pop(id(ev), None)
+
+    def task_done(self):
+        # Kept for asyncio.Queue compatibility; nothing joins on this queue
+        pass
+
+    def mark_processed(self, ev: Dict[str, Any]):
+        if self.dedup_window <= 0 or not self.coalesce:
+            return
+        key = coalesce_key(ev)
+        if key is None:
+            return
+        now = time.monotonic()
+        self._processed[key] = (now, _fingerprint(ev))
+        if len(self._processed) > 10000:
+            # Bound memory: forget entries that fell out of the window
+            self._processed = {k: v for k, v in self._processed.items() if now - v[0] <= self.dedup_window}
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "depth": self.qsize(),
+            "max_depth": self.max_depth,
+            "policy": self.policy,
+            "in_flight_entities": self.in_flight(),
+            **self.stats,
+            "lanes": {name: lane.snapshot(now) for name, lane in self.lanes.items()},
+        }
@@ -1,10 +1,24 @@
 # server/graph/event_router.py
-from server.graph.tool_nodes import execute_tool_call, _normalize_call
+import asyncio
+from server.graph.tool_nodes import execute_tool_call_async, tool_spec, _normalize_call
 
-def route_and_execute(triage_output):
-    results = []
-    for call in triage_output.tools_to_call or []:
-        norm = _normalize_call(call)
-        res = execute_tool_call(call)
-        results.append({"call": norm, "result": res})
-    return results
+async def _run_after(deps, call):
+    # Declared ordering: wait for the earlier calls this one depends on, whatever their outcome
+    if deps:
+        await asyncio.wait(deps)
+    return await execute_tool_call_async(call)
+
+async def route_and_execute(triage_output):
+    calls = [_normalize_call(call) for call in triage_output.tools_to_call or []]
+    specs = [tool_spec(call["name"]) for call in calls]
+    if all(spec is None or spec.inline for spec in specs):
+        # Only sync tools: nothing to overlap, run them in order without tasks
+        return [{"call": call, "result": await execute_tool_call_async(call)} for call in calls]
+    tasks = []
+    for i, (call, spec) in enumerate(zip(calls, specs)):
+        after = spec.after if spec is not None else ()
+        deps = [tasks[j] for j in range(i) if calls[j]["name"] in after]
+        tasks.append(asyncio.ensure_future(_run_after(deps, call)))
+    results = await asyncio.gather(*tasks)
+    # Same order and {"call", "result"} shape as the calls were listed in
+    return [{"call": call, "result": res} for call, res in zip(calls, results)]
@@ -0,0 +1,180 @@
+# server/graph/file_watch.py
+import ctypes, ctypes.util, json, os, struct, threading, time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from server.config import FEED_RESYNC_SECONDS
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class DirWatcher:
+    """
+    Non-blocking inotify watch on one directory (Linux only), shared by every
+    consumer of that directory. Each drained event bumps a generation counter;
+    dirty(name, seen) reports whether the file changed after the generation a
+    consumer last saw, so one consumer never hides a change from another.
+    Where inotify is unavailable `available` is False and callers fall back
+    to stat checks.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.available = False
+        self._fd = -1
+        self._generation = 0
+        # name -> generation of its latest event; lost events touch every name
+        self._touched: Dict[str, int] = {}
+        self._overflow_generation = 0
+        self._lock = threading.Lock()
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                return
+            mask = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+                os.close(fd)
+                return
+            self._fd = fd
+            self.available = True
+        except Exception:
+            return
+
+    def _drain(self):
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            except OSError:
+                self._generation += 1
+                self._overflow_generation = self._generation
+                return
+            pos = 0
+            while pos + _EVENT_HEADER.size <= len(buf):
+                _wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, pos)
+                pos += _EVENT_HEADER.size
+                name = buf[pos:pos + length].rstrip(b"\0").decode(errors="replace")
+                pos += length
+                if mask & _IN_Q_OVERFLOW:
+                    self._generation += 1
+                    self._overflow_generation = self._generation
+                elif name:
+                    self._generation += 1
+                    self._touched[name] = self._generation
+
+    def dirty(self, name: str, seen: int) -> Tuple[bool, int]:
+        # (changed after generation `seen`, current generation to pass next time)
+        with self._lock:
+            self._drain()
+            last = max(self._touched.get(name, 0), self._overflow_generation)
+            return last > seen, self._generation
+
+
+_WATCHERS: Dict[str, DirWatcher] = {}
+_WATCHERS_LOCK = threading.Lock()
+
+
+def _watcher_for(directory: str) -> DirWatcher:
+    directory = os.path.realpath(directory)
+    with _WATCHERS_LOCK:
+        if directory not in _WATCHERS:
+            _WATCHERS[directory] = DirWatcher(directory)
+        return _WATCHERS[directory]
+
+
+def file_identity(path: str):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class FeedChanges(NamedTuple):
+    upserts: List[Dict[str, Any]]
+    removed: List[Any]
+    full: bool
+
+
+class FileFeed:
+    """
+    Change-driven view of a JSON list file keyed by a record id. poll()
+    re-parses only when the file changed (inotify event, else mtime/size/inode)
+    and returns just the records that were added, changed or removed since the
+    previous poll. Every resync_seconds it hands back the whole snapshot once
+    (without re-reading the file) so long-standing conditions are re-raised.
+    """
+    def __init__(self, path: str, key: str = "id", resync_seconds: float = FEED_RESYNC_SECONDS,
+                 use_inotify: bool = True):
+        self.path = path
+        self.key = key
+        self.resync_seconds = resync_seconds
+        self.snapshot: Dict[Any, Dict[str, Any]] = {}
+        self.parses = 0
+        self._identity = None
+        self._last_full = 0.0
+        self._loaded = False
+        self._watch_generation = 0
+        self._watcher = _watcher_for(os.path.dirname(path)) if use_inotify else None
+        if self._watcher is not None and not self._watcher.available:
+            self._watcher = None
+
+    def _changed_on_disk(self) -> bool:
+        if self._watcher is not None:
+            touched, self._watch_generation = self._watcher.dirty(os.path.basename(self.path), self._watch_generation)
+            if self._loaded and not touched:
+                return False
+        try:
+            identity = file_identity(self.path)
+        except OSError:
+            return False
+        if identity == self._identity:
+            return False
+        self._identity = identity
+        return True
+
+    def _load(self) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except Exception:
+            # Missing or half-written file: keep the previous snapshot
+            self._identity = None
+            return None
+        self.parses += 1
+        return data if isinstance(data, list) else []
+
+    def _fetch(self) -> Optional[List[Dict[str, Any]]]:
+        # The current records when the source changed since the last poll, else None
+        if not self._changed_on_disk():
+            return None
+        return self._load()
+
+    def poll(self) -> FeedChanges:
+        upserts: List[Dict[str, Any]] = []
+        removed: List[Any] = []
+        records = self._fetch()
+        if records is not None:
+            self._loaded = True
+            current: Dict[Any, Dict[str, Any]] = {}
+            for i, rec in enumerate(records):
+                if not isinstance(rec, dict):
+                    continue
+                # Records without an id are keyed by position
+                rid = rec.get(self.key, ("#", i))
+                current[rid] = rec
+                if self.snapshot.get(rid) != rec:
+                    upserts.append(rec)
+            removed = [rid for rid in self.snapshot if rid not in current]
+            self.snapshot = current
+        now = time.monotonic()
+        if self.resync_seconds and now - self._last_full >= self.resync_seconds:
+            self._last_full = now
+            return FeedChanges(list(self.snapshot.values()), removed, True)
+        return FeedChanges(upserts, removed, False)
@@ -0,0 +1,186 @@
+# server/graph/machine_store.py
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+import numpy as np
+from server.rule_engine import RULES
+from server.config import MACHINE_UPSET_TEMPERATURE
+
+# shopfloor_loop raises this event type; its rules in the triage rule file define the severity masks
+UPSET_EVENT_TYPE = "machine_upset"
+# Rule fields backed by a column; conditions on any other field are checked record by record
+COLUMN_FIELDS = ("temperature", "vibration")
+
+STATUS_CODES = {"running": 0, "stopped": 1, "maintenance": 2}
+UNKNOWN_STATUS = -1
+_STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+def _number(value: Any, default: float = 0.0) -> float:
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # Unparseable readings compare False against every threshold
+        return float("nan")
+
+
+class MachineStore:
+    """
+    Columnar machine state: NumPy arrays for temperature, vibration and
+    status code, an id -> row index and the last full record per row (for
+    event payloads). Upset detection is one vectorized comparison
+    (temperature > MACHINE_UPSET_TEMPERATURE); the S1/S2 masks evaluate the
+    machine_upset rules of the triage rule file over all rows (first match
+    wins, as in RuleEngine), so threshold edits in the file apply here on
+    the next scan. Rows touched since the last scan are tracked in a dirty
+    mask so shopfloor_loop only raises events for machines that actually
+    changed.
+    Removal swaps the last row into the hole, so rows stay dense.
+    """
+    def __init__(self, capacity: int = 1024, upset_temperature: float = MACHINE_UPSET_TEMPERATURE):
+        capacity = max(1, capacity)
+        self.upset_temperature = upset_temperature
+        self.ids: List[Any] = []
+        self.index: Dict[Any, int] = {}
+        self.records: List[Dict[str, Any]] = []
+        self.temperature = np.zeros(capacity, dtype=np.float64)
+        self.vibration = np.zeros(capacity, dtype=np.float64)
+        self.status = np.full(capacity, UNKNOWN_STATUS, dtype=np.int8)
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _grow(self, needed: int):
+        cap = len(self.temperature)
+        if needed <= cap:
+            return
+        while cap < needed:
+            cap *= 2
+        for name in ("temperature", "vibration", "status", "dirty"):
+            old = getattr(self, name)
+            fill = UNKNOWN_STATUS if name == "status" else 0
+            new = np.full(cap, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _row_for(self, mid: Any) -> int:
+        row = self.index.get(mid)
+        if row is None:
+            row = len(self.ids)
+            self._grow(row + 1)
+            self.index[mid] = row
+            self.ids.append(mid)
+            self.records.append({"id": mid})
+        return row
+
+    def upsert(self, records: Iterable[Dict[str, Any]]) -> int:
+        # Bulk update from machine records (dicts as in machines.json); returns rows written
+        n = 0
+        with self._lock:
+            for rec in records:
+                if not isinstance(rec, dict) or rec.get("id") is None:
+                    continue
+                row = self._row_for(rec["id"])
+                self.records[row] = rec
+                self.temperature[row] = _number(rec.get("temperature"))
+                self.vibration[row] = _number(rec.get("vibration"))
+                self.status[row] = STATUS_CODES.get(rec.get("status"), UNKNOWN_STATUS)
+                self.dirty[row] = True
+                n += 1
+        return n
+
+    def remove(self, ids: Iterable[Any]):
+        with self._lock:
+            for mid in ids:
+                row = self.index.pop(mid, None)
+                if row is None:
+                    continue
+                last = len(self.ids) - 1
+                if row != last:
+                    moved = self.ids[last]
+                    self.ids[row] = moved
+                    self.records[row] = self.records[last]
+                    self.index[moved] = row
+                    for col in (self.temperature, self.vibration, self.status, self.dirty):
+                        col[row] = col[last]
+                self.ids.pop()
+                self.records.pop()
+                self.status[last] = UNKNOWN_STATUS
+                self.dirty[last] = False
+
+    def status_of(self, mid: Any):
+        # Status name last written for a machine (None if unknown)
+        with self._lock:
+            row = self.index.get(mid)
+            return None if row is None else _STATUS_NAMES.get(int(self.status[row]))
+
+    def mark_all_dirty(self):
+        with self._lock:
+            self.dirty[:len(self.ids)] = True
+
+    def _condition_mask(self, field: str, op, value: Any, n: int) -> np.ndarray:
+        if field in COLUMN_FIELDS and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return op(getattr(self, field)[:n], value)
+        out = np.zeros(n, dtype=bool)
+        for row in range(n):
+            try:
+                out[row] = bool(op(RULES.field_value(field, {"type": UPSET_EVENT_TYPE, "payload": self.records[row]}), value))
+            except TypeError:
+                continue
+        return out
+
+    def _rule_masks(self) -> Tuple[np.ndarray, Dict[Any, np.ndarray]]:
+        # (rows matching any rule, severity -> rows whose first matching rule has it)
+        n = len(self.ids)
+        matched = np.zeros(n, dtype=bool)
+        by_severity: Dict[Any, np.ndarray] = {}
+        for severity, mode, conds in RULES.conditions(UPSET_EVENT_TYPE):
+            if conds:
+                masks = [self._condition_mask(field, op, value, n) for field, op, value in conds]
+                hit = np.logical_or.reduce(masks) if mode == "any" else np.logical_and.reduce(masks)
+            else:
+                hit = np.ones(n, dtype=bool)
+            first = hit & ~matched
+            matched |= hit
+            by_severity[severity] = by_severity[severity] | first if severity in by_severity else first
+        return matched, by_severity
+
+    # Vectorized masks over the live rows
+    def upset_mask(self) -> np.ndarray:
+        return self.temperature[:len(self.ids)] > self.upset_temperature
+
+    def severity_mask(self, severity: str) -> np.ndarray:
+        return self._rule_masks()[1].get(severity, np.zeros(len(self.ids), dtype=bool))
+
+    def s1_mask(self) -> np.ndarray:
+        return self.severity_mask("S1")
+
+    def s2_mask(self) -> np.ndarray:
+        return self.severity_mask("S2")
+
+    def scan_upsets(self) -> List[Dict[str, Any]]:
+        # Records of changed rows over the upset temperature; clears the dirty mask
+        with self._lock:
+            n = len(self.ids)
+            dirty = self.dirty[:n]
+            rows = np.flatnonzero(dirty & self.upset_mask())
+            dirty[:] = False
+            records = self.records
+            return [records[r] for r in rows.tolist()]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            by_severity = self._rule_masks()[1]
+            return {
+                "machines": len(self.ids),
+                "upset": int(np.count_nonzero(self.upset_mask())),
+                **{str(sev).lower(): int(np.count_nonzero(mask)) for sev, mask in by_severity.items()},
+            }
+
+
+MACHINE_STORE = MachineStore()
@@ -1,9 +1,12 @@
 # server/graph/tool_nodes.py
-from typing import Any, Dict
+import asyncio, inspect
+from typing import Any, Callable, Dict, Iterable, Optional
 from server.tools.production_tools import stop_machine, schedule_maintenance, update_order_schedule, log_event
 from server.tools.notify_tools import notify
 from server.graph.state import ToolCall
+from server.config import TOOL_TIMEOUT_SECONDS, TOOL_TIMEOUTS, TOOL_MAX_CONCURRENCY, TOOL_CONCURRENCY
 
+# A tool may be a plain function or an async function (e.g. a network call to a PLC/MES stand-in)
 TOOL_MAP = {
     "stop_machine": stop_machine,
     "schedule_maintenance": schedule_maintenance,
@@ -12,6 +15,93 @@ TOOL_MAP = {
     "log": log_event
 }
 
+# Sync tools that stand in for blocking PLC/MES calls: run in a worker thread so the
+# per-tool timeout and concurrency limit apply to them
+OFFLOADED_TOOLS = ("stop_machine", "schedule_maintenance", "update_order")
+
+# Within one triage output, a call waits for every earlier call to the tools listed here;
+# calls without constraints run concurrently
+TOOL_ORDER = {
+    "schedule_maintenance": ("stop_machine",),
+}
+
+
+def _parse_overrides(spec: str, cast) -> Dict[str, Any]:
+    # "stop_machine:5,notify:2" -> {"stop_machine": 5, "notify": 2}
+    out: Dict[str, Any] = {}
+    for part in spec.split(","):
+        name, _, value = part.strip().partition(":")
+        if name and value:
+            out[name] = cast(value)
+    return out
+
+
+_TIMEOUTS = _parse_overrides(TOOL_TIMEOUTS, float)
+_CONCURRENCY = _parse_overrides(TOOL_CONCURRENCY, int)
+
+
+class ToolSpec:
+    """
+    How the router runs one tool. Async tools are awaited under the tool's
+    timeout and concurrency limit. Sync tools run inline on the event loop,
+    as before (they must not block); offload=True moves a blocking sync
+    tool to a worker thread so the timeout and limit apply to it too.
+    """
+    def __init__(self, fn: Callable[..., Any], after: Iterable[str] = (), timeout: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, offload: bool = False):
+        self.fn = fn
+        self.is_async = inspect.iscoroutinefunction(fn)
+        self.offload = offload and not self.is_async
+        self.after = tuple(after)
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency or 1)
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop = None
+        self.stats = {"calls": 0, "timeouts": 0, "errors": 0}
+
+    @property
+    def inline(self) -> bool:
+        return not (self.is_async or self.offload)
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # One per event loop (tests and runners may start more than one)
+        loop = asyncio.get_running_loop()
+        if self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._sem_loop = loop
+        return self._sem
+
+
+TOOL_SPECS: Dict[str, ToolSpec] = {}
+
+
+def register_tool(name: str, fn: Callable[..., Any], after: Iterable[str] = (), timeout: Optional[float] = None,
+                  max_concurrency: Optional[int] = None, offload: bool = False) -> ToolSpec:
+    # Config overrides (TOOL_TIMEOUTS / TOOL_CONCURRENCY) win over the values given here
+    spec = ToolSpec(fn, after=after or TOOL_ORDER.get(name, ()),
+                    timeout=_TIMEOUTS.get(name, timeout if timeout is not None else TOOL_TIMEOUT_SECONDS),
+                    max_concurrency=_CONCURRENCY.get(name, max_concurrency or TOOL_MAX_CONCURRENCY),
+                    offload=offload)
+    TOOL_MAP[name] = fn
+    TOOL_SPECS[name] = spec
+    return spec
+
+
+def tool_spec(name: Any) -> Optional[ToolSpec]:
+    fn = TOOL_MAP.get(name)
+    if fn is None:
+        return None
+    spec = TOOL_SPECS.get(name)
+    if spec is None or spec.fn is not fn:
+        # Added to (or replaced in) TOOL_MAP directly: register with defaults
+        spec = register_tool(name, fn)
+    return spec
+
+
+for _name, _fn in list(TOOL_MAP.items()):
+    register_tool(_name, _fn, offload=_name in OFFLOADED_TOOLS)
+
+
 def _normalize_call(call: Any) -> Dict[str, Any]:
     if isinstance(call, ToolCall):
         return {"name": call.name, "args": call.args or {}}
@@ -21,11 +111,40 @@ def _normalize_call(call: Any) -> Dict[str, Any]:
     return {"name": None, "args": {}}
 
 def execute_tool_call(call: dict | ToolCall):
+    # Synchronous entry point (scripts, no running loop); async tools are run to completion
     norm = _normalize_call(call)
     name = norm.get("name")
     args = norm.get("args", {})
     if name in TOOL_MAP:
         fn = TOOL_MAP[name]
-        return fn(**args)
+        result = fn(**args)
+        return asyncio.run(result) if inspect.isawaitable(result) else result
     else:
         return {"error":"unknown_tool", "tool": name}
+
+async def execute_tool_call_async(call: dict | ToolCall):
+    norm = _normalize_call(call)
+    name = norm.get("name")
+    args = norm.get("args", {})
+    spec = tool_spec(name)
+    if spec is None:
+        return {"error":"unknown_tool", "tool": name}
+    spec.stats["calls"] += 1
+    try:
+        if spec.inline:
+            result = spec.fn(**args)
+            return await result if inspect.isawaitable(result) else result
+        async with spec.semaphore():
+            work = spec.fn(**args) if spec.is_async else asyncio.to_thread(spec.fn, **args)
+            return await asyncio.wait_for(work, spec.timeout) if spec.timeout else await work
+    except asyncio.TimeoutError:
+        spec.stats["timeouts"] += 1
+        return {"error":"timeout", "tool": name, "timeout_seconds": spec.timeout}
+    except Exception as e:
+        # One failing call (bad arguments included) must not sink the calls running next to it
+        spec.stats["errors"] += 1
+        return {"error":"tool_failed", "tool": name, "detail": str(e)}
+
+def snapshot_tools() -> Dict[str, Any]:
+    return {name: {"async": spec.is_async, "offload": spec.offload, "after": list(spec.after), **spec.stats}
+            for name, spec in TOOL_SPECS.items()}
@@ -1,12 +1,9 @@
 # server/graph/triage_graph.py
-from server.llm import triage as triage_fn
+from server.llm import triage_async as triage_async_fn
 from server.graph.state import TriageOutput, Event, ToolCall
 from typing import Dict,Any
 
-def triage_run(event: Event) -> TriageOutput:
-    # Convert to simple dict and call MockLLM
-    evdict = {"source": event.source, "type": event.type, "payload": event.payload}
-    result = triage_fn(evdict)
+def _to_output(result: Dict[str, Any]) -> TriageOutput:
     # convert tools_to_call names to ToolCall objects if present
     tools_list = result.get("tools_to_call", [])
     tri = TriageOutput(
@@ -16,3 +13,8 @@ def triage_run(event: Event) -> TriageOutput:
         tools_to_call=[ToolCall(**t) if isinstance(t, dict) else t for t in tools_list]
     )
     return tri
+
+async def triage_run_async(event: Event) -> TriageOutput:
+    # Convert to a simple dict; the OpenAI path goes through the pooled async client
+    evdict = {"source": event.source, "type": event.type, "payload": event.payload}
+    return _to_output(await triage_async_fn(evdict))
@@ -0,0 +1,131 @@
+# server/ingest.py
+import json
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from pydantic import ValidationError
+from server.graph.state import Event
+from server.config import INGEST_CHUNK_SIZE, INGEST_MAX_EVENTS, INGEST_MAX_BODY_BYTES
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+
+class IngestError(ValueError):
+    """The request body as a whole could not be read as events (HTTP 400)."""
+
+
+class BodyTooLarge(IngestError):
+    """The request body is larger than INGEST_MAX_BODY_BYTES (HTTP 413)."""
+
+
+def _line_item(index: int, line: bytes) -> Tuple[int, Any]:
+    try:
+        return index, json.loads(line)
+    except ValueError as e:
+        return index, IngestError(f"invalid JSON: {e}")
+
+
+async def read_event_chunks(chunks: AsyncIterator[bytes], content_type: str = "",
+                            chunk_size: int = INGEST_CHUNK_SIZE,
+                            max_events: int = INGEST_MAX_EVENTS,
+                            max_bytes: int = INGEST_MAX_BODY_BYTES) -> AsyncIterator[List[Tuple[int, Any]]]:
+    """
+    Yield lists of (index, parsed item) from a JSON array or NDJSON body,
+    chunk_size items at a time. NDJSON is parsed line by line as the body
+    streams in; an array is parsed once it is complete. A line that is not
+    valid JSON becomes an IngestError item instead of failing the request.
+    A body over max_bytes raises BodyTooLarge as soon as it is exceeded.
+    """
+    ndjson = any(t in content_type for t in NDJSON_TYPES)
+    # bytearray: appending chunks is amortized O(1), unlike bytes concatenation
+    buf = bytearray()
+    received = 0
+    mode = "ndjson" if ndjson else None
+    index = 0
+    batch: List[Tuple[int, Any]] = []
+    async for chunk in chunks:
+        received += len(chunk)
+        if max_bytes and received > max_bytes:
+            raise BodyTooLarge(f"request body too large (max {max_bytes} bytes)")
+        buf += chunk
+        if mode is None:
+            head = buf.lstrip()
+            if not head:
+                continue
+            mode = "array" if head[:1] == b"[" else "ndjson"
+        if mode == "array" or b"\n" not in chunk:
+            continue
+        *lines, rest = buf.split(b"\n")
+        buf = bytearray(rest)
+        for line in lines:
+            if not line.strip():
+                continue
+            if index >= max_events:
+                raise IngestError(f"too many events (max {max_events})")
+            batch.append(_line_item(index, line))
+            index += 1
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+    if mode == "array":
+        try:
+            items = json.loads(buf)
+        except ValueError as e:
+            raise IngestError(f"invalid JSON array: {e}")
+        if not isinstance(items, list):
+            raise IngestError("expected a JSON array of events")
+        if len(items) > max_events:
+            raise IngestError(f"too many events (max {max_events})")
+        for start in range(0, len(items), chunk_size):
+            yield list(enumerate(items[start:start + chunk_size], start))
+        return
+    if buf.strip():
+        if index >= max_events:
+            raise IngestError(f"too many events (max {max_events})")
+        batch.append(_line_item(index, buf))
+    if batch:
+        yield batch
+
+
+def validate_chunk(chunk: List[Tuple[int, Any]]) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    # -> ([(index, event)], [invalid result])
+    valid, invalid = [], []
+    for index, item in chunk:
+        if isinstance(item, Exception):
+            invalid.append({"index": index, "status": "invalid", "error": str(item)})
+            continue
+        if not isinstance(item, dict):
+            invalid.append({"index": index, "status": "invalid", "error": "event must be a JSON object"})
+            continue
+        try:
+            Event(**item)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            invalid.append({"index": index, "status": "invalid", "error": errors})
+            continue
+        valid.append((index, item))
+    return valid, invalid
+
+
+async def ingest(chunks: AsyncIterator[bytes], content_type: str, publish_many) -> List[Dict[str, Any]]:
+    """
+    Validate and enqueue a bulk body chunk by chunk; one publish_many() call
+    (one queue lock and backpressure check) per chunk. Returns a result per
+    event, in input order. The whole body is read before anything is
+    published, so an IngestError (too many events, too large) leaves the
+    queue untouched and the request can be retried as is.
+    """
+    results: List[Dict[str, Any]] = []
+    parsed = [chunk async for chunk in read_event_chunks(chunks, content_type)]
+    for chunk in parsed:
+        valid, invalid = validate_chunk(chunk)
+        statuses = await publish_many([ev for _, ev in valid]) if valid else []
+        merged = invalid + [{"index": i, "status": st} for (i, _), st in zip(valid, statuses)]
+        merged.sort(key=lambda r: r["index"])
+        results.extend(merged)
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    counts = Counter(r["status"] for r in results)
+    return {"received": len(results), **{k: counts.get(k, 0) for k in
+            ("enqueued", "coalesced", "suppressed", "dropped", "rejected", "invalid")}}
@@ -1,89 +1,277 @@
 # server/llm.py
+import asyncio
 import json
 import os
-from typing import Dict, Any
-from server.config import USE_OPENAI_TRIAGE, TRIAGE_MODEL, OPENAI_API_KEY
+import random
+import time
+from typing import Dict, Any, List, Tuple
+from server.config import USE_OPENAI_TRIAGE, TRIAGE_MODEL, OPENAI_API_KEY, OPENAI_BASE_URL
+from server.config import TRIAGE_MAX_IN_FLIGHT, TRIAGE_TIMEOUT_SECONDS, TRIAGE_RETRIES, TRIAGE_BACKOFF_SECONDS
+from server.config import TRIAGE_BREAKER_THRESHOLD, TRIAGE_BREAKER_COOLDOWN_SECONDS
+from server.config import TRIAGE_BATCH_SIZE, TRIAGE_BATCH_WAIT_MS
+from server.triage_cache import TRIAGE_CACHE
+from server.rule_engine import RULES
 
 # Use MockLLM for deterministic demo; swap to OpenAI client when needed.
 class MockLLM:
     """
-    Return deterministic triage responses based on event.
+    Return deterministic triage responses based on event, using the compiled
+    rule table from server/rules/triage_rules.json.
     """
     def triage(self, event: Dict[str,Any]) -> Dict[str,Any]:
-        etype = event.get("type")
-        # Treat generic machine upset (temp/vibration) similar to overheat
-        if etype in ("machine_overheat", "machine_upset"):
-            temp = event.get("payload", {}).get("temperature", event.get("temperature", 0))
-            vib = event.get("payload", {}).get("vibration", event.get("vibration", 0))
-            if temp >= 120:
-                return {
-                    "severity":"S1",
-                    "category":"Machine",
-                    "rationale": f"Temp {temp}C > 120C",
-                    "tools_to_call": [
-                        {"name":"stop_machine","args":{"machine_id": event.get("payload", {}).get("id", event.get("machine_id"))}},
-                        {"name":"schedule_maintenance","args":{"machine_id": event.get("payload", {}).get("id", event.get("machine_id"))}},
-                        {"name":"notify","args":{"role":"supervisor","message":f"Machine overheat detected","level":"critical"}}
-                    ]
-                }
-            elif temp >= 100 or vib >= 1.2:
-                return {
-                    "severity":"S2",
-                    "category":"Machine",
-                    "rationale": f"Upset: temp {temp}C or vibration {vib}",
-                    "tools_to_call":[{"name":"notify","args":{"role":"maintenance","message":"High temp","level":"warning"}}]
-                }
-        if etype == "order_delay":
-            dp = event.get("payload", {}).get("delay_percent", event.get("delay_percent",0))
-            if dp >= 50:
-                return {
-                    "severity":"S2","category":"Order",
-                    "rationale": f"Delay {dp}%",
-                    "tools_to_call":[
-                        {"name":"update_order","args":{"order_id": event.get("payload",{}).get("order_id", event.get("order_id")), "new_due_in_hours": 3}},
-                        {"name":"notify","args":{"role":"planner","message":"Order heavily delayed","level":"warning"}}
-                    ]
-                }
-            elif dp >= 20:
-                return {"severity":"S3","category":"Order","rationale":"Moderate delay","tools_to_call":[{"name":"notify","args":{"role":"planner","message":"Order delayed","level":"info"}}]}
-        if etype in ("ppe_missing","unsafe_zone_entry","ppe_violation"):
-            return {
-                "severity":"S1","category":"Safety",
-                "rationale":"PPE missing / unsafe zone entry",
-                "tools_to_call":[{"name":"notify","args":{"role":"supervisor","message":"Safety violation detected","level":"critical"}}]
-            }
-        # fallback
-        return {"severity":"S4","category":"Unknown","rationale":"No issue","tools_to_call":[]}
+        return RULES.triage(event)
+
+    def triage_many(self, events: List[Dict[str,Any]]) -> List[Dict[str,Any]]:
+        return RULES.triage_many(events)
 
 # create instance
 llm = MockLLM()
 
-def triage_with_openai(event: Dict[str, Any]) -> Dict[str, Any]:
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY or None)
-        prompt = (
-            "You are a manufacturing triage agent. Return ONLY JSON with keys: "
-            "severity, category, rationale, tools_to_call (list of {name,args}).\n"
-            f"Event: {json.dumps(event)}"
-        )
-        resp = client.chat.completions.create(
-            model=TRIAGE_MODEL,
-            messages=[{"role": "system", "content": "Respond with strict JSON only."},
-                      {"role": "user", "content": prompt}],
-            temperature=0.1,
+def _triage_messages(event: Dict[str, Any]):
+    prompt = (
+        "You are a manufacturing triage agent. Return ONLY JSON with keys: "
+        "severity, category, rationale, tools_to_call (list of {name,args}).\n"
+        f"Event: {json.dumps(event)}"
+    )
+    return [{"role": "system", "content": "Respond with strict JSON only."},
+            {"role": "user", "content": prompt}]
+
+def _parse_triage_content(content: str) -> Dict[str, Any]:
+    data = json.loads(content)
+    if not isinstance(data, dict):
+        raise ValueError("triage output is not a JSON object")
+    # basic shape guard
+    if not isinstance(data.get("tools_to_call", []), list):
+        data["tools_to_call"] = []
+    return data
+
+class AsyncTriageClient:
+    """
+    Async OpenAI triage with one shared AsyncOpenAI client (and so one HTTP
+    connection pool), a semaphore bounding in-flight calls, a per-call
+    timeout and jittered exponential backoff between retries. A circuit
+    breaker opens after `breaker_threshold` consecutive provider failures and
+    routes everything to MockLLM for `breaker_cooldown` seconds, then lets a
+    single trial call through. Point OPENAI_BASE_URL at a stub server to test.
+    """
+    def __init__(self, max_in_flight: int = TRIAGE_MAX_IN_FLIGHT, timeout: float = TRIAGE_TIMEOUT_SECONDS,
+                 retries: int = TRIAGE_RETRIES, backoff: float = TRIAGE_BACKOFF_SECONDS,
+                 breaker_threshold: int = TRIAGE_BREAKER_THRESHOLD, breaker_cooldown: float = TRIAGE_BREAKER_COOLDOWN_SECONDS):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_in_flight = max_in_flight
+        self._sem: asyncio.Semaphore | None = None
+        self._client = None
+        self._failures = 0
+        self._open_until = 0.0
+        self._trial_in_flight = False
+        self.stats = {"calls": 0, "ok": 0, "errors": 0, "retries": 0, "fallbacks": 0, "breaker_opens": 0}
+
+    def _get_client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            # Retries are ours (with jitter), so the SDK's own are disabled
+            self._client = AsyncOpenAI(api_key=OPENAI_API_KEY or None, base_url=OPENAI_BASE_URL or None,
+                                       timeout=self.timeout, max_retries=0)
+        return self._client
+
+    def breaker_state(self) -> str:
+        if self._failures < self.breaker_threshold:
+            return "closed"
+        return "open" if time.monotonic() < self._open_until else "half_open"
+
+    def _allow(self) -> bool:
+        state = self.breaker_state()
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def _record(self, ok: bool):
+        self._trial_in_flight = False
+        if ok:
+            self._failures = 0
+            return
+        self._failures += 1
+        if self._failures >= self.breaker_threshold:
+            if time.monotonic() >= self._open_until:
+                self.stats["breaker_opens"] += 1
+            self._open_until = time.monotonic() + self.breaker_cooldown
+
+    async def _call(self, messages) -> str:
+        resp = await asyncio.wait_for(
+            self._get_client().chat.completions.create(model=TRIAGE_MODEL, messages=messages, temperature=0.1),
+            self.timeout,
         )
-        content = resp.choices[0].message.content
-        data = json.loads(content)
-        # basic shape guard
-        if not isinstance(data.get("tools_to_call", []), list):
-            data["tools_to_call"] = []
-        return data
-    except Exception:
-        # fallback to deterministic mock
-        return llm.triage(event)
+        return resp.choices[0].message.content
+
+    async def complete(self, messages) -> str | None:
+        # Raw completion with retries and breaker accounting; None means "use the fallback"
+        trial = self.breaker_state() == "half_open"
+        if not self._allow():
+            return None
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_in_flight)
+        try:
+            async with self._sem:
+                for attempt in range(self.retries + 1):
+                    self.stats["calls"] += 1
+                    try:
+                        content = await self._call(messages)
+                        self.stats["ok"] += 1
+                        self._record(True)
+                        return content
+                    except Exception:
+                        self.stats["errors"] += 1
+                        if attempt == self.retries or self.breaker_state() == "half_open":
+                            break
+                        self.stats["retries"] += 1
+                        await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            self._record(False)
+            return None
+        finally:
+            # A cancelled trial call must not leave the breaker waiting on it forever
+            if trial:
+                self._trial_in_flight = False
+
+    async def model_triage(self, event: Dict[str, Any]) -> Dict[str, Any] | None:
+        content = await self.complete(_triage_messages(event))
+        if content is not None:
+            try:
+                return _parse_triage_content(content)
+            except Exception:
+                # Malformed output is not a provider failure; just fall back
+                pass
+        self.stats["fallbacks"] += 1
+        return None
+
+    async def triage(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        data = await self.model_triage(event)
+        return data if data is not None else llm.triage(event)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"breaker": self.breaker_state(), "consecutive_failures": self._failures, **self.stats}
+
 
-def triage(event: Dict[str, Any]) -> Dict[str, Any]:
-    if USE_OPENAI_TRIAGE and OPENAI_API_KEY:
-        return triage_with_openai(event)
+TRIAGE_CLIENT = AsyncTriageClient()
+
+
+def _batch_messages(events):
+    prompt = (
+        "You are a manufacturing triage agent. For EACH event below return one triage object with keys: "
+        "severity, category, rationale, tools_to_call (list of {name,args}). "
+        f"Return ONLY a JSON array of exactly {len(events)} objects, in the same order as the events.\n"
+        f"Events: {json.dumps(events)}"
+    )
+    return [{"role": "system", "content": "Respond with strict JSON only."},
+            {"role": "user", "content": prompt}]
+
+def _validate_triage(item: Any) -> Dict[str, Any]:
+    if not isinstance(item, dict) or not isinstance(item.get("severity"), str):
+        raise ValueError("invalid triage item")
+    if not isinstance(item.get("tools_to_call", []), list):
+        item["tools_to_call"] = []
+    return item
+
+
+class TriageBatcher:
+    """
+    Micro-batches model triage: events submitted by router workers (one worker
+    submits a whole batch drained from the queue under backlog) are collected
+    until max_batch are waiting or max_wait_ms has passed, then
+    sent as one request that must return a JSON array of triage objects. Each
+    item is validated on its own; a missing or malformed item (or a failed
+    request) falls back to MockLLM for that event only.
+    """
+    def __init__(self, client: AsyncTriageClient, max_batch: int = TRIAGE_BATCH_SIZE,
+                 max_wait_ms: float = TRIAGE_BATCH_WAIT_MS):
+        self.client = client
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[tuple] = []
+        self._timer: asyncio.Task | None = None
+        # Running batch requests; the loop only keeps weak references to tasks
+        self._tasks: set = set()
+        self.stats = {"batches": 0, "batched_events": 0, "item_fallbacks": 0}
+
+    async def submit(self, event: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        # Returns (decision, from_model)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((event, fut))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await fut
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait)
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if self._pending and self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _run(self, batch):
+        events = [ev for ev, _ in batch]
+        self.stats["batches"] += 1
+        self.stats["batched_events"] += len(events)
+        items: List[Any] = []
+        try:
+            content = await self.client.complete(_batch_messages(events))
+            if content is not None:
+                data = json.loads(content)
+                items = data.get("results", []) if isinstance(data, dict) else data
+                items = items if isinstance(items, list) else []
+        except Exception:
+            items = []
+        for i, (ev, fut) in enumerate(batch):
+            if fut.done():
+                continue
+            try:
+                fut.set_result((_validate_triage(items[i]), True))
+            except Exception:
+                self.stats["item_fallbacks"] += 1
+                fut.set_result((llm.triage(ev), False))
+
+    def snapshot(self) -> Dict[str, Any]:
+        avg = self.stats["batched_events"] / self.stats["batches"] if self.stats["batches"] else 0.0
+        return {"max_batch": self.max_batch, "pending": len(self._pending), "avg_batch": round(avg, 2), **self.stats}
+
+
+TRIAGE_BATCHER = TriageBatcher(TRIAGE_CLIENT)
+
+def uses_openai() -> bool:
+    return bool(USE_OPENAI_TRIAGE and OPENAI_API_KEY)
+
+# Model decisions are cached by event fingerprint; MockLLM fallbacks never are.
+async def triage_async(event: Dict[str, Any]) -> Dict[str, Any]:
+    if uses_openai():
+        cached = TRIAGE_CACHE.get(event)
+        if cached is not None:
+            return cached
+        if TRIAGE_BATCHER.max_batch > 1:
+            data, from_model = await TRIAGE_BATCHER.submit(event)
+            if not from_model:
+                return data
+        else:
+            data = await TRIAGE_CLIENT.model_triage(event)
+        if data is None:
+            return llm.triage(event)
+        TRIAGE_CACHE.put(event, data)
+        return data
     return llm.triage(event)
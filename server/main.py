@@ -1,15 +1,25 @@
 # server/main.py
-import asyncio, os, json
-from fastapi import FastAPI, HTTPException, Query, WebSocket
+import asyncio, json
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.responses import Response, StreamingResponse
 from fastapi.websockets import WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from server.graph.runner import run_event
 from server.graph.agents_loops import shopfloor_loop, order_loop, safety_log_loop
 from server.graph.engine import GLOBAL_GRAPH
+from server.graph.event_queue import QueueFull
 from server.agents.supervisor_agent import loop as supervisor_loop
-from server.realtime import MANAGER
+from server.realtime import MANAGER, describe_subscription, notify_safety_resolved, parse_subscription
+from server.triage_cache import TRIAGE_CACHE
+from server.ingest import BodyTooLarge, IngestError, ingest, summarize
+from server.state_stream import STATE_STREAM
+from server.repository import DATASETS
 from server.tools.production_tools import log_event
-from server.config import DATA_DIR
+from server.tools.safety_store import flush_loop as safety_flush_loop, flush_resolutions, resolve_many
+from server.tools.action_log import ACTION_LOG, read_logs, query_logs, await_logs_durable
+from server.response_cache import RESPONSE_CACHE, VersionClock, encode_json
+from server.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from server.config import LOGS_PAGE_MAX, LOGS_UNPAGED_CAP, INGEST_MAX_BODY_BYTES
 
 app = FastAPI(title="Agentic Manufacturing - LangGraph PoC")
 
@@ -20,43 +30,96 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def read_json(path):
-    if not os.path.exists(path):
-        return []
-    try:
-        with open(path) as f:
-            return json.load(f)
-    except Exception:
-        # Return empty on malformed JSON to avoid crashing endpoints
-        return []
-
+# GET bodies are cached pre-encoded per dataset version and served with ETag / Last-Modified (304 on match)
 @app.get("/machines")
-def machines():
-    return read_json(os.path.join(DATA_DIR,"machines.json"))
+def machines(request: Request):
+    return RESPONSE_CACHE.respond(request, RESPONSE_CACHE.get_dataset("machines", DATASETS["machines"]))
 
 @app.get("/orders")
-def orders():
-    return read_json(os.path.join(DATA_DIR,"orders.json"))
+def orders(request: Request):
+    return RESPONSE_CACHE.respond(request, RESPONSE_CACHE.get_dataset("orders", DATASETS["orders"]))
 
 @app.get("/safety_logs")
-def safety_logs():
-    return read_json(os.path.join(DATA_DIR,"safety_logs.json"))
+def safety_logs(request: Request):
+    return RESPONSE_CACHE.respond(request, RESPONSE_CACHE.get_dataset("safety_logs", DATASETS["safety_logs"]))
+
+@app.post("/safety_logs/resolve")
+async def resolve_safety_logs(body: dict):
+    # Body: {"ids": [...]}. Resolved together and written back with one atomic write.
+    ids = body.get("ids")
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, (str, int)) and not isinstance(i, bool) for i in ids):
+        raise HTTPException(status_code=400, detail="ids must be a non-empty list of safety log ids")
+    results = resolve_many(ids)
+    resolved = [log_id for log_id, st in results.items() if st == "resolved"]
+    if resolved:
+        log_event({"actor": "api", "action": "safety_resolved", "log_ids": resolved})
+        for log_id in resolved:
+            await notify_safety_resolved(log_id)
+    return {"status": "ok", "resolved": len(resolved),
+            "results": [{"id": log_id, "status": st} for log_id, st in results.items()]}
+
+_LOGS_CLOCK = VersionClock()
 
 @app.get("/logs")
-def logs():
-    return read_json(os.path.join(DATA_DIR,"action_log.json"))
+def logs(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=LOGS_PAGE_MAX),
+    cursor: str | None = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    since: str | None = Query(None, description="ISO timestamp; only entries at or after it"),
+    actor: str | None = None,
+    agent: str | None = None,
+    action: str | None = None,
+    target: str | None = None,
+    level: str | None = None,
+):
+    filters = {"actor": actor, "agent": agent, "action": action, "target": target, "level": level}
+    if limit is None and cursor is None and since is None and all(v is None for v in filters.values()):
+        # Legacy shape: plain newest-first list, capped; cached until the next append
+        entry = RESPONSE_CACHE.get("logs", _LOGS_CLOCK(ACTION_LOG.last_seq()),
+                                   lambda: encode_json(read_logs(LOGS_UNPAGED_CAP)))
+        return RESPONSE_CACHE.respond(request, entry)
+    try:
+        return query_logs(limit=limit or 100, cursor=cursor, since=since, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/publish_event")
 async def publish_event(event: dict, async_mode: bool = Query(False, description="If true, enqueue and return immediately")):
     try:
         if async_mode:
-            await GLOBAL_GRAPH.publish(event)
-            return {"status":"ok","enqueued": True}
+            enqueued = await GLOBAL_GRAPH.publish(event)
+            return {"status":"ok","enqueued": enqueued}
         res = await run_event(event)
         return {"status":"ok","result":res, "enqueued": False}
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/publish_events")
+async def publish_events(request: Request, stream: bool = Query(False, description="If true, stream one NDJSON result line per event")):
+    # Body: a JSON array of events, or NDJSON (one event per line). Always enqueues (no inline processing).
+    length = request.headers.get("content-length", "")
+    if INGEST_MAX_BODY_BYTES and length.isdigit() and int(length) > INGEST_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail=f"request body too large (max {INGEST_MAX_BODY_BYTES} bytes)")
+    try:
+        results = await ingest(request.stream(), request.headers.get("content-type", ""), GLOBAL_GRAPH.publish_many)
+    except BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    summary = summarize(results)
+    if summary["rejected"] and not (summary["enqueued"] or summary["coalesced"]):
+        raise HTTPException(status_code=429, detail={"message": "event queue full", **summary})
+    if stream:
+        def lines():
+            for start in range(0, len(results), 1000):
+                yield "".join(json.dumps(r) + "\n" for r in results[start:start + 1000])
+            yield json.dumps({"summary": summary}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    errors = [r for r in results if r["status"] in ("invalid", "dropped", "rejected")]
+    return {"status": "ok", **summary, "errors": errors}
+
 @app.on_event("startup")
 async def startup_event():
     loop = asyncio.get_event_loop()
@@ -65,11 +128,28 @@ async def startup_event():
     loop.create_task(safety_log_loop())
     loop.create_task(GLOBAL_GRAPH.run_loop())
     loop.create_task(supervisor_loop())
+    loop.create_task(STATE_STREAM.run())
+    loop.create_task(safety_flush_loop())
     log_event({"actor":"system","action":"startup","msg":"Background agent loops started."})
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Make sure the group-commit writer has persisted everything queued so far
+    await await_logs_durable(timeout=5)
+    flush_resolutions()
+    TRIAGE_CACHE.save()
+
 @app.get("/memory")
-def memory_state():
-    return GLOBAL_GRAPH.snapshot_memory()
+async def memory_state():
+    # async: runs on the event loop, which owns the queue, client and repository state it reads
+    return {**GLOBAL_GRAPH.snapshot_memory(), "state_stream": STATE_STREAM.snapshot_stats(),
+            "response_cache": RESPONSE_CACHE.snapshot(),
+            "repository": {name: ds.snapshot() for name, ds in DATASETS.items()}}
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format: stage / event-age / loop-scan / WS-send histograms plus queue and client gauges
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
 
 
 @app.websocket("/ws")
@@ -77,7 +157,29 @@ async def websocket_endpoint(ws: WebSocket):
     await MANAGER.connect(ws)
     try:
         while True:
-            # Keep the connection open; ignore incoming messages for now
-            await ws.receive_text()
+            # {"type": "subscribe", "types": [...], "machine_ids": [...], ...} narrows what this socket receives;
+            # {"type": "unsubscribe"} goes back to everything. {"type": "state_subscribe"} starts the
+            # snapshot + delta state stream and {"type": "state_resync"} asks for a fresh snapshot.
+            # Other messages are ignored.
+            try:
+                msg = json.loads(await ws.receive_text())
+            except ValueError:
+                continue
+            if not isinstance(msg, dict):
+                continue
+            if msg.get("type") == "subscribe":
+                try:
+                    sub = parse_subscription(msg)
+                except ValueError as e:
+                    MANAGER.send_to(ws, {"type": "error", "data": {"detail": str(e)}})
+                    continue
+                MANAGER.subscribe(ws, sub)
+                MANAGER.send_to(ws, {"type": "subscribed", "data": describe_subscription(sub)})
+            elif msg.get("type") in ("state_subscribe", "state_resync"):
+                MANAGER.follow_state(ws)
+                MANAGER.send_to(ws, STATE_STREAM.snapshot())
+            elif msg.get("type") == "unsubscribe":
+                MANAGER.subscribe(ws, {})
+                MANAGER.send_to(ws, {"type": "subscribed", "data": {}})
     except WebSocketDisconnect:
         MANAGER.disconnect(ws)
@@ -0,0 +1,134 @@
+# server/metrics.py
+import bisect, math, threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# Seconds; spans sub-millisecond rule triage up to model calls and slow sockets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram per label set. observe() is a bisect plus three
+    additions under a lock, cheap enough for every event; buckets are only
+    made cumulative when /metrics renders them.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[Any, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: Any):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        lines = []
+        for labels, counts, total, count in sorted(series, key=lambda s: tuple(map(str, s[0]))):
+            running = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                running += n
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    A gauge or counter read from existing state when /metrics is scraped.
+    fn returns a number, or {label value(s): number} when labelnames is set.
+    """
+    def __init__(self, name: str, help: str, fn: Callable[[], Any], labelnames: Sequence[str] = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        value = self.fn()
+        if not self.labelnames:
+            return [f"{self.name} {_fmt(value)}"]
+        lines = []
+        for labels, v in value.items():
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_fmt(v)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], Any], labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, fn, labelnames, "gauge"))
+
+    def counter(self, name: str, help: str, fn: Callable[[], Any], labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, fn, labelnames, "counter"))
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        out = []
+        for metric in self.metrics.values():
+            try:
+                lines = metric.render()
+            except Exception:
+                # A broken callback must not take the whole scrape down
+                continue
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "shopfloor_event_stage_seconds", "Time spent in each stage of GlobalRouterGraph.process_one", ("stage",))
+EVENT_AGE_SECONDS = REGISTRY.histogram(
+    "shopfloor_event_age_seconds", "Time from publish (first enqueue) to the end of processing", ("lane",))
+LOOP_SCAN_SECONDS = REGISTRY.histogram(
+    "shopfloor_loop_scan_seconds", "Duration of one scan of a background loop", ("loop",))
+WS_SEND_SECONDS = REGISTRY.histogram(
+    "shopfloor_ws_send_seconds", "Duration of one WebSocket frame send to a client")
@@ -1,43 +1,357 @@
-from typing import Any, Dict, Set
+import asyncio, json, time
+from collections import deque
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
 from fastapi import WebSocket
-from server.tools.production_tools import append_log as _append_log 
+from server.config import WS_SEND_QUEUE_MAX, WS_SLOW_CLIENT_POLICY, WS_SEND_TIMEOUT_SECONDS
+from server.metrics import REGISTRY, WS_SEND_SECONDS
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "disconnect")
+
+# Subscription dimensions. A client that sets a dimension only receives messages
+# carrying a matching value for it; unset dimensions match everything.
+# machine_ids / order_ids / safety_ids all filter the one "entities" dimension.
+SUB_DIMENSIONS = ("types", "entities", "severities", "categories")
+_ENTITY_FIELDS = {"machine_ids": "machine", "order_ids": "order", "safety_ids": "safety"}
+# Only delivered to clients that asked for the state stream (see server/state_stream.py)
+STATE_MESSAGE_TYPES = ("state_delta",)
+
+
+def parse_subscription(msg: Dict[str, Any]) -> Dict[str, FrozenSet]:
+    # {"type": "subscribe", "types": [...], "machine_ids": [...], ...} -> {dimension: values}
+    spec: Dict[str, FrozenSet] = {}
+    for field in ("types", "severities", "categories", *_ENTITY_FIELDS):
+        values = msg.get(field)
+        if values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, list) or not all(isinstance(v, (str, int)) for v in values):
+            raise ValueError(f"{field} must be a list of strings")
+        if field in _ENTITY_FIELDS:
+            kind = _ENTITY_FIELDS[field]
+            spec["entities"] = spec.get("entities", frozenset()) | {(kind, str(v)) for v in values}
+        else:
+            spec[field] = frozenset(str(v) for v in values)
+    return {dim: values for dim, values in spec.items() if values}
+
+
+def describe_subscription(spec: Dict[str, FrozenSet]) -> Dict[str, List[str]]:
+    # Inverse of parse_subscription, for acks
+    out: Dict[str, List[str]] = {dim: sorted(values) for dim, values in spec.items() if dim != "entities"}
+    for field, kind in _ENTITY_FIELDS.items():
+        ids = sorted(v for k, v in spec.get("entities", ()) if k == kind)
+        if ids:
+            out[field] = ids
+    return out
+
+
+def _event_entities(ev: Any, out: Set[Tuple[str, str]]):
+    if not isinstance(ev, dict):
+        return
+    etype = str(ev.get("type") or "")
+    payload = ev.get("payload") if isinstance(ev.get("payload"), dict) else {}
+    for src in (payload, ev):
+        if src.get("machine_id") is not None:
+            out.add(("machine", str(src["machine_id"])))
+        if src.get("order_id") is not None:
+            out.add(("order", str(src["order_id"])))
+    if payload.get("id") is not None:
+        if etype.startswith("machine") or ev.get("source") == "ShopFloorAgent":
+            out.add(("machine", str(payload["id"])))
+        elif ev.get("source") == "SafetyAgent" or etype == "safety_resolve":
+            out.add(("safety", str(payload["id"])))
+
+
+def _call_entities(calls: Iterable[Any], out: Set[Tuple[str, str]]):
+    for call in calls or ():
+        call = call.get("call", call) if isinstance(call, dict) else None
+        args = call.get("args") if isinstance(call, dict) else None
+        if isinstance(args, dict):
+            _event_entities({"payload": args}, out)
+
+
+_TARGET_KIND = {"stop_machine": "machine", "schedule_maintenance": "machine", "update_order": "order"}
+
+
+def message_attrs(payload: Dict[str, Any]) -> Dict[str, Set]:
+    """The values a broadcast carries for each subscription dimension."""
+    data = payload.get("data") if isinstance(payload.get("data"), dict) else {}
+    entities: Set[Tuple[str, str]] = set()
+    severities: Set[str] = set()
+    categories: Set[str] = set()
+    mtype = payload.get("type")
+    if mtype == "safety_resolved" and data.get("id") is not None:
+        entities.add(("safety", str(data["id"])))
+    _event_entities(data.get("event"), entities)
+    triage = data.get("triage")
+    if isinstance(triage, dict):
+        if triage.get("severity"):
+            severities.add(str(triage["severity"]))
+        if triage.get("category"):
+            categories.add(str(triage["category"]))
+        _call_entities(triage.get("tools_to_call"), entities)
+    _call_entities(data.get("executed"), entities)
+    kind = _TARGET_KIND.get(data.get("action"))
+    if kind and data.get("target") is not None:
+        entities.add((kind, str(data["target"])))
+    if data.get("log_id") is not None:
+        entities.add(("safety", str(data["log_id"])))
+    return {"types": {mtype} if mtype else set(), "entities": entities,
+            "severities": severities, "categories": categories}
+
+
+class _Client:
+    __slots__ = ("ws", "queue", "wake", "task", "dropped", "subscription", "follows_state")
+
+    def __init__(self, ws: WebSocket):
+        self.ws = ws
+        self.follows_state = False
+        self.subscription: Dict[str, FrozenSet] = {}
+        self.queue: deque = deque()
+        self.wake = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active: Set[WebSocket] = set()
+    """
+    WebSocket fan-out. publish() only appends to a pending list; everything
+    published in the same event-loop tick is flushed as one frame (a
+    {"type": "batch"} wrapper when there is more than one message), encoded
+    once and shared by every client. Each client has a bounded outbound queue
+    drained by its own task, so a slow dashboard only ever delays itself:
+    when its queue is full the oldest frame is dropped ("drop_oldest") or the
+    client is cut off ("disconnect"). A send that exceeds send_timeout also
+    disconnects the client.
+
+    Clients may subscribe to a subset of messages (see parse_subscription).
+    Subscriptions are kept in an inverted index per dimension, so each
+    message is matched against the index rather than every client, and
+    clients that end up with the same messages in a tick share one encoded
+    frame.
+    """
+    def __init__(self, max_queue: int = WS_SEND_QUEUE_MAX, policy: str = WS_SLOW_CLIENT_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"unknown slow client policy: {policy}")
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.clients: Dict[WebSocket, _Client] = {}
+        # dimension -> value -> clients filtering on it; plus clients with no filter per dimension
+        self._index: Dict[str, Dict[Any, Set[_Client]]] = {dim: {} for dim in SUB_DIMENSIONS}
+        self._unfiltered: Dict[str, Set[_Client]] = {dim: set() for dim in SUB_DIMENSIONS}
+        self._state_clients: Set[_Client] = set()
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_scheduled = False
+        # The loop publish() last ran on; calls from worker threads are handed to it
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"messages": 0, "frames": 0, "batched_frames": 0, "frames_sent": 0,
+                      "frames_dropped": 0, "slow_disconnects": 0}
+
+    @property
+    def active(self):
+        return set(self.clients)
 
     async def connect(self, ws: WebSocket):
         await ws.accept()
-        self.active.add(ws)
+        client = _Client(ws)
+        self.clients[ws] = client
+        self._index_add(client)
+        client.task = asyncio.get_running_loop().create_task(self._drain(client))
 
     def disconnect(self, ws: WebSocket):
-        if ws in self.active:
-            self.active.remove(ws)
+        client = self.clients.pop(ws, None)
+        if client is not None:
+            self._index_remove(client)
+            self._state_clients.discard(client)
+        if client is not None and client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def _index_add(self, client: _Client):
+        for dim in SUB_DIMENSIONS:
+            values = client.subscription.get(dim)
+            if not values:
+                self._unfiltered[dim].add(client)
+                continue
+            for v in values:
+                self._index[dim].setdefault(v, set()).add(client)
+
+    def _index_remove(self, client: _Client):
+        for dim in SUB_DIMENSIONS:
+            self._unfiltered[dim].discard(client)
+            for v in client.subscription.get(dim, ()):
+                subs = self._index[dim].get(v)
+                if subs is not None:
+                    subs.discard(client)
+                    if not subs:
+                        del self._index[dim][v]
+
+    def subscribe(self, ws: WebSocket, subscription: Dict[str, FrozenSet]):
+        client = self.clients.get(ws)
+        if client is None:
+            return
+        self._index_remove(client)
+        client.subscription = subscription
+        self._index_add(client)
+
+    def follow_state(self, ws: WebSocket):
+        client = self.clients.get(ws)
+        if client is not None:
+            client.follows_state = True
+            self._state_clients.add(client)
+
+    def send_to(self, ws: WebSocket, payload: Dict[str, Any]):
+        # Direct reply to one client (acks, errors), through its queue
+        client = self.clients.get(ws)
+        if client is not None:
+            self._enqueue(client, json.dumps(payload, default=str))
+
+    def _match(self, payload: Dict[str, Any]) -> Set[_Client]:
+        if payload.get("type") in STATE_MESSAGE_TYPES:
+            return self._state_clients
+        attrs = message_attrs(payload)
+        matched: Optional[Set[_Client]] = None
+        for dim in SUB_DIMENSIONS:
+            allowed = set(self._unfiltered[dim])
+            index = self._index[dim]
+            for v in attrs[dim]:
+                subs = index.get(v)
+                if subs:
+                    allowed |= subs
+            matched = allowed if matched is None else matched & allowed
+            if not matched:
+                break
+        return matched or set()
+
+    def publish(self, payload: Dict[str, Any]):
+        # Non-blocking. From a worker thread (an offloaded tool) the message is handed to the
+        # event loop; without any loop it is a no-op.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None and not self._loop.is_closed():
+                try:
+                    self._loop.call_soon_threadsafe(self.publish, payload)
+                except RuntimeError:
+                    pass
+            return
+        self._loop = loop
+        self._pending.append(payload)
+        self.stats["messages"] += 1
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
 
     async def broadcast_json(self, payload: Dict[str, Any]):
-        dead = []
-        for ws in list(self.active):
-            try:
-                await ws.send_json(payload)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.disconnect(ws)
+        self.publish(payload)
+
+    def _encode(self, messages: List[Dict[str, Any]]) -> str:
+        if len(messages) == 1:
+            return json.dumps(messages[0], default=str)
+        self.stats["batched_frames"] += 1
+        return json.dumps({"type": "batch", "data": messages}, default=str)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        messages, self._pending = self._pending, []
+        if not messages or not self.clients:
+            return
+        if all(not c.subscription for c in self.clients.values()) \
+                and not any(m.get("type") in STATE_MESSAGE_TYPES for m in messages):
+            groups = {tuple(range(len(messages))): list(self.clients.values())}
+        else:
+            selected: Dict[_Client, List[int]] = {}
+            for i, msg in enumerate(messages):
+                for client in self._match(msg):
+                    selected.setdefault(client, []).append(i)
+            # Clients that receive exactly the same messages share one encoded frame
+            groups: Dict[Tuple[int, ...], List[_Client]] = {}
+            for client, idx in selected.items():
+                groups.setdefault(tuple(idx), []).append(client)
+        for idx, clients in groups.items():
+            frame = self._encode([messages[i] for i in idx])
+            self.stats["frames"] += 1
+            for client in clients:
+                self._enqueue(client, frame)
+
+    def _enqueue(self, client: _Client, frame: str):
+        if len(client.queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                self.stats["slow_disconnects"] += 1
+                self._drop_client(client)
+                return
+            client.queue.popleft()
+            client.dropped += 1
+            self.stats["frames_dropped"] += 1
+        client.queue.append(frame)
+        client.wake.set()
+
+    def _drop_client(self, client: _Client):
+        self.disconnect(client.ws)
+        asyncio.get_running_loop().create_task(self._close(client.ws))
+
+    async def _close(self, ws: WebSocket):
+        try:
+            await ws.close(code=1008)
+        except Exception:
+            pass
+
+    async def _drain(self, client: _Client):
+        try:
+            while True:
+                await client.wake.wait()
+                client.wake.clear()
+                while client.queue:
+                    frame = client.queue.popleft()
+                    started = time.perf_counter()
+                    await asyncio.wait_for(client.ws.send_text(frame), self.send_timeout)
+                    WS_SEND_SECONDS.observe(time.perf_counter() - started)
+                    self.stats["frames_sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.stats["slow_disconnects"] += 1
+            self._drop_client(client)
+        except Exception:
+            # Socket closed under us
+            self.disconnect(client.ws)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self.clients),
+            "subscribed_clients": sum(1 for c in self.clients.values() if c.subscription),
+            "state_clients": len(self._state_clients),
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "queued_frames": sum(len(c.queue) for c in self.clients.values()),
+            **self.stats,
+        }
 
 
 MANAGER = ConnectionManager()
 
+REGISTRY.gauge("shopfloor_ws_clients", "Connected WebSocket clients", lambda: len(MANAGER.clients))
+REGISTRY.gauge("shopfloor_ws_queued_frames", "Frames waiting in client send queues",
+               lambda: sum(len(c.queue) for c in MANAGER.clients.values()))
+REGISTRY.counter("shopfloor_ws_frames_dropped_total", "Frames dropped for slow clients",
+                 lambda: MANAGER.stats["frames_dropped"])
+
+
+def publish_log(entry: Dict[str, Any]):
+    # Called by append_log for every entry; just queues for the next flush
+    MANAGER.publish({"type": "log", "data": entry})
+
 
 async def notify_log(entry: Dict[str, Any]):
     # Broadcast a single log entry
-    await MANAGER.broadcast_json({"type": "log", "data": entry})
+    publish_log(entry)
 
 
 async def notify_triage(result: Dict[str, Any]):
     # Broadcast triage/execution result
-    await MANAGER.broadcast_json({"type": "triage", "data": result})
+    MANAGER.publish({"type": "triage", "data": result})
 
 
 async def notify_safety_resolved(log_id: str):
-    await MANAGER.broadcast_json({"type": "safety_resolved", "data": {"id": log_id}})
+    MANAGER.publish({"type": "safety_resolved", "data": {"id": log_id}})
@@ -0,0 +1,260 @@
+# server/repository.py
+import threading, time
+from typing import Any, Callable, Dict, List, Optional
+from server.graph.file_watch import FileFeed
+from server.storage import StorageBackend, get_backend
+
+# Order due windows (hours) for the ORDERS "due_window" index
+DUE_WINDOWS = (1, 4, 24)
+
+
+def due_window(order: Dict[str, Any]) -> Any:
+    due = order.get("due_in_hours")
+    if isinstance(due, bool) or not isinstance(due, (int, float)):
+        return None
+    for w in DUE_WINDOWS:
+        if due <= w:
+            return w
+    return "later"
+
+
+class Dataset:
+    """
+    One collection of a StorageBackend held in memory with an id index and
+    secondary indexes (name -> value -> {id: record}). Records are never
+    mutated in place: update() swaps in a new dict, so anything holding an
+    older snapshot (feeds, cached responses) still sees a consistent copy.
+    The records list handed out by versioned() is copy-on-write: the next
+    change copies it first instead of editing the list a reader holds.
+    Writes go straight back to the backend (an atomic file rewrite for JSON,
+    one transaction over the changed rows for SQLite). Writes made by anyone
+    else change the backend's identity for the collection; they are picked
+    up on the next access and bump `version`.
+    """
+    def __init__(self, collection: str, key: str, indexes: Optional[Dict[str, Callable[[Dict[str, Any]], Any]]] = None,
+                 backend: Optional[StorageBackend] = None):
+        self.collection = collection
+        self.backend = backend or get_backend()
+        self.path = self.backend.location(collection)
+        self.key = key
+        self.index_fns = indexes or {}
+        self.records: List[Dict[str, Any]] = []
+        self.by_id: Dict[Any, Dict[str, Any]] = {}
+        self._pos: Dict[Any, int] = {}
+        # True once versioned() has handed self.records out; the next change copies it
+        self._shared = False
+        self.indexes: Dict[str, Dict[Any, Dict[Any, Dict[str, Any]]]] = {name: {} for name in self.index_fns}
+        self.version = 0
+        self.identity = None
+        # Last change (backend mtime, or the time of an unsaved in-memory change)
+        self.mtime = 0.0
+        self._loaded = False
+        # id -> changes made with write=False (the whole record for a new one), saved
+        # with the next write and re-applied if the backend is reloaded first
+        self._unsaved: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self.stats = {"loads": 0, "external_reloads": 0, "writes": 0}
+
+    # --- sync with the backend ------------------------------------------------
+    def sync(self) -> bool:
+        # True when the in-memory copy was (re)loaded from the backend
+        with self._lock:
+            identity = self.backend.identity(self.collection)
+            if self._loaded and identity == self.identity:
+                return False
+            records = [] if identity is None else self.backend.load(self.collection)
+            if records is None:
+                # Half-written or malformed: keep serving the previous copy
+                return False
+            if self._loaded:
+                self.stats["external_reloads"] += 1
+            self.stats["loads"] += 1
+            self._loaded = True
+            self.identity = identity
+            self.mtime = self.backend.mtime(self.collection)
+            pending, self._unsaved = self._unsaved, {}
+            self._rebuild(records)
+            # Unsaved in-memory changes survive an external edit; they stay pending
+            for rid, changes in pending.items():
+                if rid in self.by_id:
+                    self._apply(rid, changes)
+                elif changes.get(self.key) == rid:
+                    self._append(changes)
+                else:
+                    # Removed by the external edit; a partial change cannot bring it back
+                    continue
+                self._unsaved[rid] = changes
+            return True
+
+    def _rebuild(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self._shared = False
+        self.by_id, self._pos = {}, {}
+        self.indexes = {name: {} for name in self.index_fns}
+        for i, rec in enumerate(records):
+            if isinstance(rec, dict) and rec.get(self.key) is not None:
+                rid = rec[self.key]
+                self.by_id[rid] = rec
+                self._pos[rid] = i
+                self._index_add(rid, rec)
+        self.version += 1
+
+    def _index_add(self, rid: Any, rec: Dict[str, Any]):
+        for name, fn in self.index_fns.items():
+            self.indexes[name].setdefault(fn(rec), {})[rid] = rec
+
+    def _index_remove(self, rid: Any, rec: Dict[str, Any]):
+        for name, fn in self.index_fns.items():
+            bucket = self.indexes[name].get(fn(rec))
+            if bucket is not None:
+                bucket.pop(rid, None)
+                if not bucket:
+                    del self.indexes[name][fn(rec)]
+
+    def _own_records(self):
+        # Copy-on-write for the list versioned() returned
+        if self._shared:
+            self.records = list(self.records)
+            self._shared = False
+
+    def _apply(self, rid: Any, changes: Dict[str, Any]) -> Dict[str, Any]:
+        self._own_records()
+        old = self.by_id[rid]
+        new = {**old, **changes}
+        self._index_remove(rid, old)
+        self.by_id[rid] = new
+        self.records[self._pos[rid]] = new
+        self._index_add(rid, new)
+        return new
+
+    def _append(self, record: Dict[str, Any]):
+        rid = record[self.key]
+        self._own_records()
+        self.records.append(record)
+        self.by_id[rid] = record
+        self._pos[rid] = len(self.records) - 1
+        self._index_add(rid, record)
+
+    def _touch(self):
+        # An in-memory change: new version, and Last-Modified moves with it
+        self.version += 1
+        self.mtime = max(self.mtime, time.time())
+
+    def _save(self, changed: Optional[List[int]] = None):
+        # changed: positions written since the last save (None = all records)
+        if changed is not None:
+            changed = sorted(set(changed).union(self._pos[rid] for rid in self._unsaved if rid in self._pos))
+        self.identity = self.backend.save(self.collection, self.records, self.key, changed)
+        self.mtime = self.backend.mtime(self.collection)
+        self._unsaved.clear()
+        self.version += 1
+        self.stats["writes"] += 1
+
+    # --- reads ---------------------------------------------------------------
+    def all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.sync()
+            return list(self.records)
+
+    def versioned(self):
+        # (version, mtime, records) read together; records is not copied here but never
+        # changes afterwards (see _own_records)
+        with self._lock:
+            self.sync()
+            self._shared = True
+            return self.version, self.mtime, self.records
+
+    def get(self, rid: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self.sync()
+            return self.by_id.get(rid)
+
+    def find(self, index: str, value: Any) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.sync()
+            return list(self.indexes[index].get(value, {}).values())
+
+    def counts(self, index: str) -> Dict[Any, int]:
+        with self._lock:
+            self.sync()
+            return {value: len(bucket) for value, bucket in self.indexes[index].items()}
+
+    # --- writes --------------------------------------------------------------
+    def update(self, rid: Any, changes: Dict[str, Any], write: bool = True) -> Optional[Dict[str, Any]]:
+        # Returns the new record, or None for an unknown id
+        with self._lock:
+            self.sync()
+            if rid not in self.by_id:
+                return None
+            new = self._apply(rid, changes)
+            if write:
+                self._save([self._pos[rid]])
+            else:
+                self._unsaved[rid] = {**self._unsaved.get(rid, {}), **changes}
+                self._touch()
+            return new
+
+    def upsert(self, record: Dict[str, Any], write: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            self.sync()
+            rid = record[self.key]
+            if rid in self.by_id:
+                return self.update(rid, record, write=write)
+            self._append(record)
+            if write:
+                self._save([self._pos[rid]])
+            else:
+                self._unsaved[rid] = record
+                self._touch()
+            return record
+
+    def flush(self) -> int:
+        # Persist everything changed with write=False in one backend write; returns records written
+        with self._lock:
+            pending = len(self._unsaved)
+            if pending:
+                self._save([])
+            return pending
+
+    def replace_all(self, records: List[Dict[str, Any]]):
+        with self._lock:
+            self._rebuild(list(records))
+            self._save()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.backend.name, "records": len(self.records), "version": self.version, **self.stats}
+
+
+class DatasetFeed(FileFeed):
+    """FileFeed over a Dataset: diffs the repository's records instead of re-reading the file."""
+    def __init__(self, dataset: Dataset, resync_seconds: Optional[float] = None):
+        kwargs = {} if resync_seconds is None else {"resync_seconds": resync_seconds}
+        super().__init__(dataset.path, key=dataset.key, use_inotify=False, **kwargs)
+        self.dataset = dataset
+        self._seen_version = None
+
+    def _fetch(self) -> Optional[List[Dict[str, Any]]]:
+        self.dataset.sync()
+        if self.dataset.version == self._seen_version:
+            return None
+        self._seen_version = self.dataset.version
+        self.parses += 1
+        return self.dataset.all()
+
+
+MACHINES = Dataset("machines", "id", {"status": lambda r: r.get("status")})
+ORDERS = Dataset("orders", "order_id", {"due_window": due_window})
+SAFETY_LOGS = Dataset("safety_logs", "id", {"status": lambda r: r.get("status")})
+DATASETS = {"machines": MACHINES, "orders": ORDERS, "safety_logs": SAFETY_LOGS}
+
+
+def orders_due_within(hours: float) -> List[Dict[str, Any]]:
+    # Uses the due_window index to skip orders in later windows
+    out: List[Dict[str, Any]] = []
+    for w in DUE_WINDOWS:
+        out.extend(o for o in ORDERS.find("due_window", w) if o.get("due_in_hours") <= hours)
+        if w >= hours:
+            break
+    else:
+        out.extend(o for o in ORDERS.find("due_window", "later") if o.get("due_in_hours") <= hours)
+    return out
@@ -0,0 +1,102 @@
+# server/response_cache.py
+import hashlib, json, threading, time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Tuple
+from fastapi import Request, Response
+
+
+class CachedBody:
+    __slots__ = ("identity", "body", "etag", "last_modified", "mtime")
+
+    def __init__(self, identity: Hashable, body: bytes, mtime: float):
+        self.identity = identity
+        self.body = body
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.mtime = int(mtime)
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+
+
+def encode_json(data: Any) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+class ResponseCache:
+    """
+    Encoded GET bodies keyed by the version of their source (a repository
+    dataset's version, or the action log's last seq). A request only pays
+    for a version check while the source is unchanged; the bytes,
+    strong ETag and Last-Modified are reused, and conditional requests are
+    answered with 304.
+    """
+    def __init__(self):
+        self._entries: Dict[str, CachedBody] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "not_modified": 0}
+
+    def get(self, key: str, identity: Tuple[Hashable, float], build: Callable[[], bytes]) -> CachedBody:
+        ident, mtime = identity
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.identity == ident:
+                self.stats["hits"] += 1
+                return entry
+            self.stats["misses"] += 1
+            if entry is not None:
+                self.stats["invalidations"] += 1
+        # Built outside the lock; a concurrent rebuild of the same key is harmless
+        entry = CachedBody(ident, build(), mtime)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def get_dataset(self, key: str, dataset) -> CachedBody:
+        # dataset: a repository.Dataset; its version changes on every reload or write
+        version, mtime, records = dataset.versioned()
+        return self.get(key, (version, mtime), lambda: encode_json(records))
+
+    def respond(self, request: Request, entry: CachedBody) -> Response:
+        headers = {"ETag": entry.etag, "Last-Modified": entry.last_modified, "Cache-Control": "no-cache"}
+        if _not_modified(request, entry):
+            with self._lock:
+                self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self.stats,
+        }
+
+
+def _not_modified(request: Request, entry: CachedBody) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2); weak comparison
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or any(t.removeprefix("W/") == entry.etag for t in tags)
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return entry.mtime <= int(parsedate_to_datetime(ims).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class VersionClock:
+    """Wall-clock time at which each version was first seen; Last-Modified for non-file sources."""
+    def __init__(self):
+        self._version: Hashable = None
+        self._seen_at = time.time()
+
+    def __call__(self, version: Hashable) -> Tuple[Hashable, float]:
+        if version != self._version:
+            self._version = version
+            self._seen_at = time.time()
+        return version, self._seen_at
+
+
+RESPONSE_CACHE = ResponseCache()
@@ -0,0 +1,263 @@
+# server/rule_engine.py
+import json, logging, operator, os, re, threading, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from server.config import RULES_FILE, RULES_RELOAD_CHECK_SECONDS
+
+_OPS = {">=": operator.ge, ">": operator.gt, "<=": operator.le, "<": operator.lt,
+        "==": operator.eq, "!=": operator.ne}
+_MISSING = object()
+_WHOLE_PLACEHOLDER = re.compile(r"^\{(\w+)\}$")
+# Templates substitute plain field names only: no attribute access, indexing or format specs
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+log = logging.getLogger(__name__)
+
+
+def _compile_path(path: str) -> Callable[[Dict[str, Any]], Any]:
+    parts = path.split(".")
+    def get(ev: Dict[str, Any]):
+        cur: Any = ev
+        for p in parts:
+            if not isinstance(cur, dict) or p not in cur:
+                return _MISSING
+            cur = cur[p]
+        return cur
+    return get
+
+
+def _compile_field(spec: Dict[str, Any]) -> Callable[[Dict[str, Any]], Any]:
+    # First path present wins (even if its value is None), as in the old MockLLM lookups
+    getters = [_compile_path(p) for p in spec.get("paths", [])]
+    default = spec.get("default")
+    def get(ev: Dict[str, Any]):
+        for g in getters:
+            v = g(ev)
+            if v is not _MISSING:
+                return v
+        return default
+    return get
+
+
+class _Values(dict):
+    """Field values for one event, resolved lazily on first lookup."""
+    __slots__ = ("ev", "fields")
+
+    def __init__(self, ev: Dict[str, Any], fields: Dict[str, Callable]):
+        super().__init__()
+        self.ev = ev
+        self.fields = fields
+
+    def __missing__(self, name: str) -> Any:
+        getter = self.fields.get(name)
+        value = self[name] = getter(self.ev) if getter else None
+        return value
+
+
+def _literal(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise ValueError(f"unsupported literal in rules: {value!r}")
+
+
+def _parse_conditions(spec: Optional[Dict[str, Any]]) -> Tuple[str, List[Tuple[str, Callable, Any]]]:
+    # ("all" | "any", [(field, operator function, literal)]); no conditions always matches
+    if not spec:
+        return "all", []
+    mode = "any" if "any" in spec else "all"
+    conds = []
+    for cond in spec.get(mode, []):
+        op = _OPS.get(cond["op"])
+        if op is None:
+            raise ValueError(f"unknown operator: {cond['op']}")
+        conds.append((str(cond["field"]), op, _literal(cond["value"])))
+    return mode, conds
+
+
+def _compile_predicate(spec: Optional[Dict[str, Any]]) -> Callable[[_Values], bool]:
+    mode, conds = _parse_conditions(spec)
+    if not conds:
+        return lambda v: True
+    if len(conds) == 1:
+        (field, op, value), = conds
+        return lambda v: op(v[field], value)
+    if mode == "any":
+        return lambda v: any(op(v[field], value) for field, op, value in conds)
+    return lambda v: all(op(v[field], value) for field, op, value in conds)
+
+
+def _compile_text(text: str) -> Callable[[_Values], Any]:
+    # "{field}" alone keeps the raw value; otherwise each {field} is replaced by str(value)
+    whole = _WHOLE_PLACEHOLDER.match(text)
+    if whole:
+        name = whole.group(1)
+        return lambda v: v[name]
+    parts = _PLACEHOLDER.split(text)
+    if any("{" in p or "}" in p for p in parts[::2]):
+        raise ValueError(f"unsupported placeholder in rules: {text!r}")
+    literals, names = parts[::2], parts[1::2]
+    def render(v: _Values) -> str:
+        out = [literals[0]]
+        for name, lit in zip(names, literals[1:]):
+            out.append(str(v[name]))
+            out.append(lit)
+        return "".join(out)
+    return render
+
+
+def _is_text_template(obj: Any) -> bool:
+    return isinstance(obj, str) and ("{" in obj or "}" in obj)
+
+
+def _compile_template(obj: Any) -> Callable[[_Values], Any]:
+    # A fresh output per call, so callers may mutate what they get back. Constant
+    # keys are copied from a prebuilt dict; only templated ones run per event
+    if isinstance(obj, dict):
+        base: Dict[str, Any] = {}
+        dynamic = []
+        for k, x in obj.items():
+            if isinstance(x, (dict, list)) or _is_text_template(x):
+                base[str(k)] = None
+                dynamic.append((str(k), _compile_template(x)))
+            else:
+                base[str(k)] = _literal(x)
+        if not dynamic:
+            return lambda v: base.copy()
+        def build(v: _Values) -> Dict[str, Any]:
+            out = base.copy()
+            for k, f in dynamic:
+                out[k] = f(v)
+            return out
+        return build
+    if isinstance(obj, list):
+        fns = [_compile_template(x) for x in obj]
+        return lambda v: [f(v) for f in fns]
+    if _is_text_template(obj):
+        return _compile_text(obj)
+    value = _literal(obj)
+    return lambda v: value
+
+
+class RuleEngine:
+    """
+    Triage rules loaded from a JSON data file and compiled into a dispatch
+    table: event type -> ordered (predicate, output template) pairs. A
+    predicate is a closure over a fixed set of comparison operators and a
+    template only substitutes plain {field} names, so nothing in the data
+    file is ever evaluated as code. The first matching rule for the event's
+    type wins; otherwise the default output applies. The file is re-checked
+    at most every reload_check seconds and hot-reloaded when it changes; a
+    broken edit keeps the previous table and is logged. A file that cannot
+    be loaded at startup raises, rather than triaging everything as S4.
+    """
+    def __init__(self, path: str = RULES_FILE, reload_check: float = RULES_RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.reload_check = reload_check
+        # (fields, dispatch, default), swapped as one tuple on reload
+        self._table: Tuple[Dict[str, Callable], Dict[str, List[Tuple[Callable, Callable]]], Callable] = ({}, {}, lambda v: {})
+        # event type -> [(severity, mode, conditions)] per rule, for conditions()
+        self._conditions: Dict[str, List[Tuple[Any, str, List[Tuple[str, Callable, Any]]]]] = {}
+        self.last_error: Optional[str] = None
+        self.reloads = 0
+        self._identity = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        if not self.load():
+            raise RuntimeError(f"cannot load triage rules from {self.path}: {self.last_error}")
+
+    def _file_identity(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def compile(self, spec: Dict[str, Any]):
+        fields = {name: _compile_field(f) for name, f in spec.get("fields", {}).items()}
+        dispatch: Dict[str, List[Tuple[Callable, Callable]]] = {}
+        for rule in spec.get("rules", []):
+            compiled = (
+                _compile_predicate(rule.get("when")),
+                _compile_template({k: rule.get(k) for k in ("severity", "category", "rationale", "tools_to_call")}),
+            )
+            for etype in rule.get("types", []):
+                dispatch.setdefault(etype, []).append(compiled)
+        default = _compile_template(spec.get("default", {"severity": "S4", "category": "Unknown",
+                                                         "rationale": "No issue", "tools_to_call": []}))
+        return fields, dispatch, default
+
+    def load(self) -> bool:
+        try:
+            identity = self._file_identity()
+            with open(self.path) as f:
+                spec = json.load(f)
+            fields, dispatch, default = self.compile(spec)
+            conditions: Dict[str, List[Tuple[Any, str, List[Tuple[str, Callable, Any]]]]] = {}
+            for rule in spec.get("rules", []):
+                parsed = (rule.get("severity"), *_parse_conditions(rule.get("when")))
+                for etype in rule.get("types", []):
+                    conditions.setdefault(etype, []).append(parsed)
+        except Exception as e:
+            self.last_error = str(e)
+            log.error("triage rules %s not loaded, keeping the previous table: %s", self.path, e)
+            return False
+        with self._lock:
+            self._table = (fields, dispatch, default)
+            self._conditions = conditions
+            self._identity = identity
+            self.last_error = None
+            self.reloads += 1
+        return True
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_check
+        try:
+            if self._file_identity() != self._identity:
+                self.load()
+        except OSError:
+            pass
+
+    @property
+    def dispatch(self) -> Dict[str, List[Tuple[Callable, Callable]]]:
+        return self._table[1]
+
+    def conditions(self, etype: str) -> List[Tuple[Any, str, List[Tuple[str, Callable, Any]]]]:
+        """
+        (severity, "all" | "any", [(field, operator, value)]) for each rule on
+        etype, in order, for callers that evaluate the same thresholds another
+        way (MachineStore's vectorized masks). First match wins, as in triage().
+        """
+        self.maybe_reload()
+        return self._conditions.get(etype, [])
+
+    def field_value(self, name: str, event: Dict[str, Any]) -> Any:
+        # One declared field resolved against an event (None for an unknown field)
+        getter = self._table[0].get(name)
+        return getter(event) if getter else None
+
+    def _evaluate(self, event: Dict[str, Any], fields, dispatch, default) -> Dict[str, Any]:
+        values = _Values(event, fields)
+        for pred, output in dispatch.get(event.get("type"), ()):
+            try:
+                matched = pred(values)
+            except TypeError:
+                # e.g. a non-numeric temperature compared to a threshold
+                matched = False
+            if matched:
+                return output(values)
+        return default(values)
+
+    def triage(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self.maybe_reload()
+        return self._evaluate(event, *self._table)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"path": self.path, "reloads": self.reloads, "last_error": self.last_error,
+                "types": len(self.dispatch)}
+
+    def triage_many(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # One reload check and one table snapshot for the whole batch
+        self.maybe_reload()
+        fields, dispatch, default = self._table
+        return [self._evaluate(ev, fields, dispatch, default) for ev in events]
+
+
+RULES = RuleEngine()
@@ -0,0 +1,64 @@
+# server/state_stream.py
+import asyncio, time
+from typing import Any, Dict, List
+from server.config import LOGS_UNPAGED_CAP, STATE_STREAM_INTERVAL_SECONDS
+from server.metrics import LOOP_SCAN_SECONDS
+from server.realtime import MANAGER
+from server.repository import DATASETS, DatasetFeed
+from server.tools.action_log import read_logs
+
+
+class StateStream:
+    """
+    Server-side dashboard state: machines, orders and safety logs from the
+    repository, diffed against the last version streamed. Every change
+    becomes a record-level state_delta broadcast with the next sequence
+    number, sent only to sockets that asked for state. A client gets a
+    state_snapshot (current seq + full collections + recent logs) when it
+    subscribes or asks for a resync after spotting a gap in the sequence.
+    Server cost follows the change rate, not clients x poll rate.
+    """
+    def __init__(self, datasets=None, interval: float = STATE_STREAM_INTERVAL_SECONDS):
+        self.interval = interval
+        # Collection names match the REST endpoints
+        self.feeds = {name: DatasetFeed(ds, resync_seconds=0) for name, ds in (datasets or DATASETS).items()}
+        self.seq = 0
+        self.stats = {"deltas": 0, "snapshots": 0}
+        self.poll()
+
+    def poll(self) -> List[Dict[str, Any]]:
+        deltas = []
+        for name, feed in self.feeds.items():
+            changes = feed.poll()
+            if not changes.upserts and not changes.removed:
+                continue
+            self.seq += 1
+            deltas.append({"type": "state_delta", "seq": self.seq,
+                           "data": {"collection": name, "upserts": changes.upserts, "removed": changes.removed}})
+        for delta in deltas:
+            MANAGER.publish(delta)
+        self.stats["deltas"] += len(deltas)
+        return deltas
+
+    def snapshot(self) -> Dict[str, Any]:
+        self.stats["snapshots"] += 1
+        data: Dict[str, Any] = {name: list(feed.snapshot.values()) for name, feed in self.feeds.items()}
+        data["logs"] = read_logs(LOGS_UNPAGED_CAP)
+        return {"type": "state_snapshot", "seq": self.seq, "data": data}
+
+    async def run(self):
+        while True:
+            started = time.perf_counter()
+            try:
+                self.poll()
+            except Exception:
+                # Never let one bad poll end the stream
+                pass
+            LOOP_SCAN_SECONDS.observe(time.perf_counter() - started, "state_stream")
+            await asyncio.sleep(self.interval)
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        return {"seq": self.seq, **self.stats}
+
+
+STATE_STREAM = StateStream()
@@ -0,0 +1,27 @@
+# server/storage/__init__.py
+from typing import Optional
+from server.config import DATA_DIR, SQLITE_PATH, STORAGE_BACKEND
+from server.storage.base import StorageBackend
+
+BACKENDS = ("json", "sqlite")
+_BACKEND: Optional[StorageBackend] = None
+
+
+def open_backend(name: str = STORAGE_BACKEND, data_dir: str = DATA_DIR, sqlite_path: str = SQLITE_PATH) -> StorageBackend:
+    # Backend modules are imported lazily: both import action_log, which opens
+    # its log through get_backend()
+    if name == "json":
+        from server.storage.json_backend import JsonBackend
+        return JsonBackend(data_dir)
+    if name == "sqlite":
+        from server.storage.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"unknown STORAGE_BACKEND {name!r} (expected one of {', '.join(BACKENDS)})")
+
+
+def get_backend() -> StorageBackend:
+    # The process-wide backend selected by STORAGE_BACKEND
+    global _BACKEND
+    if _BACKEND is None:
+        _BACKEND = open_backend()
+    return _BACKEND
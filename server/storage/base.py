@@ -0,0 +1,48 @@
+# server/storage/base.py
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class StorageBackend:
+    """
+    Where datasets (lists of records keyed by an id field), small named
+    state documents and the action log live. repository.Dataset keeps the
+    in-memory copy and indexes; a backend only loads, saves and reports a
+    cheap identity that changes whenever a collection was written, by this
+    process or anyone else.
+    """
+    name = "base"
+
+    def location(self, collection: str) -> str:
+        raise NotImplementedError
+
+    def identity(self, collection: str) -> Optional[Hashable]:
+        # None when the collection does not exist yet
+        raise NotImplementedError
+
+    def mtime(self, collection: str) -> float:
+        raise NotImplementedError
+
+    def load(self, collection: str) -> Optional[List[Dict[str, Any]]]:
+        # None when the stored copy is unreadable (caller keeps what it has)
+        raise NotImplementedError
+
+    def save(self, collection: str, records: List[Dict[str, Any]], key: str,
+             changed: Optional[List[int]] = None) -> Optional[Hashable]:
+        """
+        Persist records; changed lists the positions that differ from the
+        stored copy (None = everything). Returns the new identity.
+        """
+        raise NotImplementedError
+
+    def load_state(self, name: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def save_state(self, name: str, state: Dict[str, Any]):
+        raise NotImplementedError
+
+    def open_log(self):
+        # An action log with SegmentedLog's interface (append/read/query/flush/...)
+        raise NotImplementedError
+
+    def close(self):
+        pass
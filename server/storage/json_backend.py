@@ -0,0 +1,92 @@
+# server/storage/json_backend.py
+import json, os, threading
+from typing import Any, Dict, Hashable, List, Optional
+from server.config import LOG_DIR, LOG_FILE
+from server.graph.file_watch import _watcher_for, file_identity
+from server.storage.base import StorageBackend
+
+
+class JsonBackend(StorageBackend):
+    """
+    One pretty-printed JSON list per collection under data_dir (the files
+    the project has always shipped), state documents as <name>.json and the
+    segmented action log under LOG_DIR. Writes are atomic (tmp +
+    os.replace). Identity is the file's (mtime_ns, size, inode), re-checked
+    only when inotify reports the file touched (every call without inotify).
+    """
+    name = "json"
+
+    def __init__(self, data_dir: str, use_inotify: bool = True):
+        self.data_dir = data_dir
+        self._identity: Dict[str, Optional[Hashable]] = {}
+        # Last watcher generation seen per collection
+        self._watch_generation: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._watcher = _watcher_for(data_dir) if use_inotify and os.path.isdir(data_dir) else None
+        if self._watcher is not None and not self._watcher.available:
+            self._watcher = None
+
+    def location(self, collection: str) -> str:
+        return os.path.join(self.data_dir, f"{collection}.json")
+
+    def identity(self, collection: str) -> Optional[Hashable]:
+        with self._lock:
+            if self._watcher is not None:
+                touched, self._watch_generation[collection] = self._watcher.dirty(
+                    f"{collection}.json", self._watch_generation.get(collection, 0))
+                if collection in self._identity and not touched:
+                    return self._identity[collection]
+            try:
+                identity = file_identity(self.location(collection))
+            except OSError:
+                identity = None
+            self._identity[collection] = identity
+            return identity
+
+    def mtime(self, collection: str) -> float:
+        identity = self._identity.get(collection)
+        return identity[0] / 1e9 if identity else 0.0
+
+    def load(self, collection: str) -> Optional[List[Dict[str, Any]]]:
+        path = self.location(collection)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except Exception:
+            # Half-written or malformed
+            return None
+        return data if isinstance(data, list) else []
+
+    def _write(self, path: str, data: Any):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    def save(self, collection: str, records: List[Dict[str, Any]], key: str,
+             changed: Optional[List[int]] = None) -> Optional[Hashable]:
+        # A JSON file can only be rewritten whole; changed is ignored
+        path = self.location(collection)
+        self._write(path, records)
+        identity = file_identity(path)
+        with self._lock:
+            self._identity[collection] = identity
+        return identity
+
+    def load_state(self, name: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.data_dir, f"{name}.json")) as f:
+                data = json.load(f)
+        except Exception:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save_state(self, name: str, state: Dict[str, Any]):
+        self._write(os.path.join(self.data_dir, f"{name}.json"), state)
+
+    def open_log(self):
+        from server.tools.action_log import SegmentedLog
+        return SegmentedLog(LOG_DIR, legacy_file=LOG_FILE)
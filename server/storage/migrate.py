@@ -0,0 +1,68 @@
+# server/storage/migrate.py
+"""
+One-shot import of the JSON data files into the SQLite backend:
+
+    python -m server.storage.migrate [--data-dir DIR] [--db PATH] [--force]
+
+Copies machines, orders and safety logs, the supervisor state and the
+whole action log (segments, or the legacy action_log.json) keeping its
+sequence numbers. The JSON files are left untouched. Run it with the
+server stopped, then start the server with STORAGE_BACKEND=sqlite.
+"""
+import argparse, json, os, sys, time
+from server.config import DATA_DIR, SQLITE_PATH
+from server.storage.json_backend import JsonBackend
+from server.storage.sqlite_backend import INSERT_LOG, SQLiteBackend, transaction
+
+COLLECTIONS = {"machines": "id", "orders": "order_id", "safety_logs": "id"}
+STATES = ("supervisor_state",)
+BATCH = 5000
+
+
+def migrate(data_dir: str = DATA_DIR, db_path: str = SQLITE_PATH, force: bool = False) -> dict:
+    from server.tools.action_log import SegmentedLog, _index_values
+    source = JsonBackend(data_dir, use_inotify=False)
+    target = SQLiteBackend(db_path)
+    conn = target._conn
+    existing = conn.execute("SELECT COUNT(*) FROM action_log").fetchone()[0]
+    if existing and not force:
+        raise SystemExit(f"{db_path} already holds {existing} log entries; use --force to replace them")
+    report = {}
+    for collection, key in COLLECTIONS.items():
+        records = source.load(collection)
+        if records is None:
+            raise SystemExit(f"{source.location(collection)} is not valid JSON")
+        target.save(collection, records, key)
+        report[collection] = len(records)
+    for name in STATES:
+        target.save_state(name, source.load_state(name))
+    # Oldest first, so seq numbers match the segmented log's
+    log = SegmentedLog(os.path.join(data_dir, "action_log"), legacy_file=os.path.join(data_dir, "action_log.json"))
+    entries = list(reversed(log.read()))
+    log.close()
+    with transaction(conn):
+        conn.execute("DELETE FROM action_log")
+        for start in range(0, len(entries), BATCH):
+            conn.executemany(INSERT_LOG, [
+                (seq, str(e.get("timestamp", "")), *_index_values(e), json.dumps(e, separators=(",", ":")))
+                for seq, e in enumerate(entries[start:start + BATCH], start + 1)])
+    report["action_log"] = len(entries)
+    target.close()
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Import the JSON data files into the SQLite storage backend")
+    ap.add_argument("--data-dir", default=DATA_DIR)
+    ap.add_argument("--db", default=SQLITE_PATH)
+    ap.add_argument("--force", action="store_true", help="replace an action log already in the database")
+    args = ap.parse_args(argv)
+    t0 = time.perf_counter()
+    report = migrate(args.data_dir, args.db, args.force)
+    for name, count in report.items():
+        print(f"{name:<14} {count:>8} records")
+    print(f"migrated to {args.db} in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+# server/storage/sqlite_backend.py
+import asyncio, atexit, json, logging, os, sqlite3, threading, time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from server.config import LOG_TAIL_SIZE, LOG_COMMIT_WINDOW_MS, LOG_COMMIT_MAX_BATCH, LOG_WRITE_MAX_RETRIES
+from server.storage.base import StorageBackend
+
+log = logging.getLogger(__name__)
+
+# Log columns mirror action_log.INDEX_FIELDS
+LOG_FIELDS = ("actor", "agent", "action", "target", "level")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS records (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_records_pos ON records (collection, pos);
+
+-- Bumped by triggers on every write, from any connection: the identity Dataset.sync() compares
+CREATE TABLE IF NOT EXISTS collections (
+    collection TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS records_insert AFTER INSERT ON records BEGIN
+    INSERT INTO collections VALUES (NEW.collection, 1, (julianday('now') - 2440587.5) * 86400.0)
+    ON CONFLICT (collection) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+CREATE TRIGGER IF NOT EXISTS records_update AFTER UPDATE ON records BEGIN
+    UPDATE collections SET version = version + 1, updated_at = (julianday('now') - 2440587.5) * 86400.0
+    WHERE collection = NEW.collection;
+END;
+CREATE TRIGGER IF NOT EXISTS records_delete AFTER DELETE ON records BEGIN
+    UPDATE collections SET version = version + 1, updated_at = (julianday('now') - 2440587.5) * 86400.0
+    WHERE collection = OLD.collection;
+END;
+
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS action_log (
+    seq INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    {", ".join(f"{f} TEXT" for f in LOG_FIELDS)},
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_action_log_ts ON action_log (ts);
+{"".join(f"CREATE INDEX IF NOT EXISTS ix_action_log_{f} ON action_log ({f}, seq);" for f in LOG_FIELDS)}
+"""
+
+# Statements are constant strings so sqlite3's statement cache prepares each once per connection
+SELECT_VERSION = "SELECT version, updated_at FROM collections WHERE collection = ?"
+# One string for the whole collection: a single json.loads instead of one per row
+SELECT_RECORDS = "SELECT group_concat(body, ',') FROM (SELECT body FROM records WHERE collection = ? ORDER BY pos)"
+DELETE_RECORDS = "DELETE FROM records WHERE collection = ?"
+UPSERT_RECORD = ("INSERT INTO records (collection, id, pos, body) VALUES (?, ?, ?, ?) "
+                 "ON CONFLICT (collection, id) DO UPDATE SET pos = excluded.pos, body = excluded.body")
+SELECT_STATE = "SELECT body FROM state WHERE name = ?"
+UPSERT_STATE = "INSERT INTO state (name, body) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET body = excluded.body"
+INSERT_LOG = (f"INSERT INTO action_log (seq, ts, {', '.join(LOG_FIELDS)}, body) "
+              f"VALUES ({', '.join('?' * (len(LOG_FIELDS) + 3))})")
+SELECT_LOG_TAIL = "SELECT body FROM action_log ORDER BY seq DESC LIMIT ?"
+SELECT_LOG_MAX = "SELECT COALESCE(MAX(seq), 0) FROM action_log"
+
+
+def connect(path: str) -> sqlite3.Connection:
+    # Autocommit connection in WAL mode; transactions are explicit (see transaction())
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL: no fsync per commit; commits survive a process crash, a power loss can drop the latest few
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    # BEGIN IMMEDIATE takes the write lock up front, so reads inside see no concurrent writer
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+def _record_id(rec: Any, key: str, pos: int) -> str:
+    rid = rec.get(key) if isinstance(rec, dict) else None
+    return f"#{pos}" if rid is None else str(rid)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Everything in one SQLite database in WAL mode: readers never block the
+    writer. A collection is one row per record (body as JSON, ordered by
+    pos); saving only the changed positions is a single upsert batch in one
+    transaction instead of rewriting the whole list. Identity is a
+    per-collection version kept by triggers, so writes from other processes
+    (or the migration tool) are picked up like an edited JSON file.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = connect(path)
+        self._lock = threading.Lock()
+
+    def location(self, collection: str) -> str:
+        return f"{self.path}#{collection}"
+
+    def _version(self, collection: str) -> Optional[Tuple[int, float]]:
+        row = self._conn.execute(SELECT_VERSION, (collection,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def identity(self, collection: str) -> Optional[Hashable]:
+        with self._lock:
+            version = self._version(collection)
+        return version[0] if version else None
+
+    def mtime(self, collection: str) -> float:
+        with self._lock:
+            version = self._version(collection)
+        return version[1] if version else 0.0
+
+    def load(self, collection: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            body = self._conn.execute(SELECT_RECORDS, (collection,)).fetchone()[0]
+        try:
+            return json.loads(f"[{body or ''}]")
+        except ValueError:
+            return None
+
+    def save(self, collection: str, records: List[Dict[str, Any]], key: str,
+             changed: Optional[List[int]] = None) -> Optional[Hashable]:
+        positions = range(len(records)) if changed is None else changed
+        rows = [(collection, _record_id(records[i], key, i), i, _dumps(records[i])) for i in positions]
+        with self._lock, transaction(self._conn) as conn:
+            if changed is None:
+                conn.execute(DELETE_RECORDS, (collection,))
+            conn.executemany(UPSERT_RECORD, rows)
+            version = self._version(collection)
+        return version[0] if version else None
+
+    def load_state(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(SELECT_STATE, (name,)).fetchone()
+        try:
+            data = json.loads(row[0]) if row else {}
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save_state(self, name: str, state: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(UPSERT_STATE, (name, _dumps(state)))
+
+    def open_log(self):
+        return SQLiteLog(self.path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SQLiteLog:
+    """
+    The action log as an indexed table (seq, ts, INDEX_FIELDS columns, JSON
+    body), with SegmentedLog's interface and write path: append() only
+    queues the entry and keeps the newest tail_size entries in memory; a
+    writer thread with its own connection inserts everything arriving within
+    commit_window_ms in one transaction. query() becomes one indexed SELECT
+    over the committed rows, merged with the matching entries still waiting
+    for the writer, so reads never wait on it.
+    """
+    def __init__(self, path: str, tail_size: int = LOG_TAIL_SIZE,
+                 commit_window_ms: float = LOG_COMMIT_WINDOW_MS, max_batch: int = LOG_COMMIT_MAX_BATCH,
+                 max_retries: int = LOG_WRITE_MAX_RETRIES):
+        self.path = path
+        self.max_retries = max_retries
+        self.commit_window = commit_window_ms / 1000.0
+        self.max_batch = max_batch
+        self.tail: deque = deque(maxlen=tail_size)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._read_lock = threading.Lock()
+        self._pending: List[Tuple[Any, ...]] = []
+        # seq -> (row, entry) for every entry not yet committed, including the writer's current batch
+        self._unwritten: Dict[int, Tuple[Tuple[Any, ...], Dict[str, Any]]] = {}
+        self._appended_seq = 0
+        self._durable_seq = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._opened = False
+        self._closed = False
+        self._writer: Optional[threading.Thread] = None
+        self._listeners: List[Any] = []
+        self.stats = {"entries_written": 0, "commits": 0, "write_errors": 0, "entries_dropped": 0}
+
+    def _open(self):
+        # Caller holds self._lock
+        if self._opened:
+            return
+        self._conn = connect(self.path)
+        self._appended_seq = self._durable_seq = self._conn.execute(SELECT_LOG_MAX).fetchone()[0]
+        self.tail.extend(json.loads(body) for body, in
+                         self._conn.execute(SELECT_LOG_TAIL, (self.tail.maxlen,)).fetchall())
+        self._writer = threading.Thread(target=self._writer_loop, name="action-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        self._opened = True
+
+    def _write_rows(self, conn: sqlite3.Connection, batch: List[Tuple[Any, ...]]) -> int:
+        # Last resort for a batch that keeps failing: one transaction per row, so only the
+        # rows that cannot be written (e.g. a duplicate seq) are lost; returns rows written
+        written = 0
+        for row in batch:
+            try:
+                with transaction(conn):
+                    conn.execute(INSERT_LOG, row)
+                written += 1
+            except Exception as e:
+                log.error("action log entry %s dropped after %d failed commits: %s: %s",
+                          row[0], self.max_retries, e, row[-1])
+        return written
+
+    def _writer_loop(self):
+        conn = connect(self.path)
+        failures = 0
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    conn.close()
+                    return
+                # Give a burst a short window to coalesce into the same transaction
+                deadline = time.monotonic() + self.commit_window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+            try:
+                with transaction(conn):
+                    conn.executemany(INSERT_LOG, batch)
+                written = len(batch)
+            except Exception:
+                failures += 1
+                with self._cond:
+                    self.stats["write_errors"] += 1
+                    if failures <= self.max_retries:
+                        self._pending[:0] = batch
+                if failures <= self.max_retries:
+                    time.sleep(0.5)
+                    continue
+                # Retries exhausted: keep what can be written and release the flush() waiters
+                written = self._write_rows(conn, batch)
+            failures = 0
+            with self._cond:
+                self._durable_seq = batch[-1][0]
+                for row in batch:
+                    self._unwritten.pop(row[0], None)
+                self.stats["entries_written"] += written
+                self.stats["entries_dropped"] += len(batch) - written
+                self.stats["commits"] += 1
+                self._cond.notify_all()
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        from server.tools.action_log import _index_values
+        row = (str(entry.get("timestamp", "")), *_index_values(entry), _dumps(entry))
+        with self._cond:
+            self._open()
+            self._appended_seq += 1
+            seq = self._appended_seq
+            self._pending.append((seq, *row))
+            self._unwritten[seq] = (self._pending[-1], entry)
+            self.tail.appendleft(entry)
+            for fn in self._listeners:
+                try:
+                    fn(seq, entry)
+                except Exception:
+                    pass
+            self._cond.notify_all()
+            return seq
+
+    def last_seq(self) -> int:
+        with self._cond:
+            self._open()
+            return self._appended_seq
+
+    def add_listener(self, fn) -> int:
+        # Same contract as SegmentedLog.add_listener
+        with self._cond:
+            self._open()
+            self._listeners.append(fn)
+            return self._appended_seq
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            if not self._opened:
+                return True
+            target = self._appended_seq
+            return self._cond.wait_for(lambda: self._durable_seq >= target, timeout)
+
+    async def await_durable(self, timeout: Optional[float] = None) -> bool:
+        return await asyncio.to_thread(self.flush, timeout)
+
+    def close(self):
+        with self._cond:
+            if not self._opened or self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        with self._read_lock:
+            self._conn.close()
+
+    def _select(self, sql: str, params: Tuple[Any, ...]) -> List[Tuple[Any, ...]]:
+        with self._read_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _queued(self, match) -> Tuple[int, List[Tuple[int, Dict[str, Any]]]]:
+        # (durable seq, newest-first (seq, entry) of uncommitted entries passing match(row));
+        # everything up to the durable seq is in the table, everything after is in memory
+        with self._lock:
+            self._open()
+            return self._durable_seq, [(seq, entry) for seq, (row, entry) in reversed(self._unwritten.items())
+                                       if match(row)]
+
+    def read(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._open()
+            if limit is not None and limit <= len(self.tail):
+                return list(self.tail)[:limit]
+        durable, queued = self._queued(lambda row: True)
+        entries = [entry for _, entry in queued][:limit]
+        if limit is not None and len(entries) >= limit:
+            return entries
+        rows = self._select("SELECT body FROM action_log WHERE seq <= ? ORDER BY seq DESC LIMIT ?",
+                            (durable, -1 if limit is None else limit - len(entries)))
+        return entries + [json.loads(body) for body, in rows]
+
+    def query(self, limit: int = 100, before: Optional[int] = None, since: Optional[str] = None,
+              **filters: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        # Same contract as SegmentedLog.query: (newest-first entries, next_before or None)
+        from server.tools.action_log import normalize_since
+        active = {f: str(v) for f, v in filters.items() if v is not None}
+        unknown = set(active) - set(LOG_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown filter: {', '.join(sorted(unknown))}")
+        since = normalize_since(since) if since is not None else None
+        checks = [(2 + LOG_FIELDS.index(f), v) for f, v in active.items()]
+
+        def match(row: Tuple[Any, ...]) -> bool:
+            return ((before is None or row[0] < before) and (since is None or row[1] >= since)
+                    and all(row[i] == v for i, v in checks))
+
+        durable, queued = self._queued(match)
+        found = queued[:limit + 1]
+        if len(found) <= limit:
+            where, params = ["seq <= ?"], [durable]
+            if before is not None:
+                where.append("seq < ?")
+                params.append(before)
+            if since is not None:
+                where.append("ts >= ?")
+                params.append(since)
+            for field in LOG_FIELDS:
+                if field in active:
+                    where.append(f"{field} = ?")
+                    params.append(active[field])
+            sql = "SELECT seq, body FROM action_log WHERE " + " AND ".join(where) + " ORDER BY seq DESC LIMIT ?"
+            params.append(limit + 1 - len(found))
+            found += [(seq, json.loads(body)) for seq, body in self._select(sql, tuple(params))]
+        more = len(found) > limit
+        found = found[:limit]
+        return [entry for _, entry in found], (found[-1][0] if more else None)
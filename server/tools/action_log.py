@@ -0,0 +1,460 @@
+# server/tools/action_log.py
+import asyncio, atexit, base64, bisect, json, os, threading, time
+from collections import deque
+from datetime import datetime, timezone
+from itertools import chain, islice
+from typing import Any, Dict, List, Optional, Tuple
+from server.config import LOG_SEGMENT_MAX_BYTES, LOG_TAIL_SIZE
+from server.config import LOG_COMMIT_WINDOW_MS, LOG_COMMIT_MAX_BATCH, LOG_READ_FLUSH_TIMEOUT_SECONDS
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+
+# Fields the index keeps postings for; each falls back to the nested "event" dict
+# so log_event({"agent": ...}) entries can be filtered by agent too.
+INDEX_FIELDS = ("actor", "agent", "action", "target", "level")
+
+
+def _encode(entry: Dict[str, Any]) -> bytes:
+    return json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _index_values(entry: Dict[str, Any]) -> Tuple[Optional[str], ...]:
+    ev = entry.get("event") if isinstance(entry.get("event"), dict) else {}
+    values = []
+    for field in INDEX_FIELDS:
+        v = entry.get(field, ev.get(field))
+        values.append(None if v is None or isinstance(v, (dict, list)) else str(v))
+    return tuple(values)
+
+
+def encode_cursor(seq: int) -> str:
+    return base64.urlsafe_b64encode(f"s:{seq}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        if not raw.startswith("s:"):
+            raise ValueError
+        return int(raw[2:])
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def normalize_since(since: str) -> str:
+    # Stored timestamps are naive UTC isoformat strings, which sort lexically
+    try:
+        dt = datetime.fromisoformat(since.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError("invalid since timestamp")
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat()
+
+
+class SegmentedLog:
+    """
+    Append-only action log. Entries are written oldest-first as one JSON object
+    per line into numbered segment files; a small ring keeps the newest entries
+    in memory so "newest first" reads rarely touch disk.
+
+    append() never does file I/O: entries are queued for a background writer
+    thread that group-commits everything arriving within commit_window_ms as
+    one write plus one fsync. flush()/await_durable() wait for durability.
+
+    Every entry gets a sequence number (1 = oldest). An in-memory index keeps
+    per-seq timestamp, segment offset and INDEX_FIELDS values plus postings
+    lists per field value, so query() pages through the log without loading it.
+    """
+    def __init__(self, log_dir: str, legacy_file: Optional[str] = None,
+                 segment_max_bytes: int = LOG_SEGMENT_MAX_BYTES, tail_size: int = LOG_TAIL_SIZE,
+                 commit_window_ms: float = LOG_COMMIT_WINDOW_MS, max_batch: int = LOG_COMMIT_MAX_BATCH):
+        self.log_dir = log_dir
+        self.legacy_file = legacy_file
+        self.segment_max_bytes = segment_max_bytes
+        self.commit_window = commit_window_ms / 1000.0
+        self.max_batch = max_batch
+        self.tail: deque = deque(maxlen=tail_size)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending: List[Tuple[int, bytes]] = []
+        self._unwritten: Dict[int, Dict[str, Any]] = {}
+        self._appended_seq = 0
+        self._written_seq = 0
+        self._durable_seq = 0
+        # After a failed commit: entries written but not fsynced / a partial line ending the segment
+        self._unsynced = False
+        self._torn = False
+        # Index, position i describes seq i + 1
+        self._ts: List[str] = []
+        self._loc: List[Optional[Tuple[int, int, int]]] = []
+        self._values: List[Tuple[Optional[str], ...]] = []
+        self._postings: Dict[str, Dict[str, List[int]]] = {f: {} for f in INDEX_FIELDS}
+        self._fh = None
+        self._segment_id = 0
+        self._segment_size = 0
+        self._opened = False
+        self._closed = False
+        self._writer: Optional[threading.Thread] = None
+        self._listeners: List[Any] = []
+        self.stats = {"entries_written": 0, "commits": 0, "write_errors": 0}
+
+    def _segment_path(self, seg_id: int) -> str:
+        return os.path.join(self.log_dir, f"{SEGMENT_PREFIX}{seg_id:06d}{SEGMENT_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        ids = []
+        for name in os.listdir(self.log_dir):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    ids.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(ids)
+
+    def _import_legacy(self):
+        # One-shot import of the old newest-first action_log.json into segment 1
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+        try:
+            with open(self.legacy_file) as f:
+                logs = json.load(f)
+            if not isinstance(logs, list):
+                return
+        except Exception:
+            return
+        path = self._segment_path(1)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for entry in reversed(logs):
+                f.write(_encode(entry))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _index_entry(self, entry: Dict[str, Any], loc: Optional[Tuple[int, int, int]]) -> int:
+        seq = len(self._ts) + 1
+        self._ts.append(str(entry.get("timestamp", "")))
+        self._loc.append(loc)
+        values = _index_values(entry)
+        self._values.append(values)
+        for field, v in zip(INDEX_FIELDS, values):
+            if v is not None:
+                self._postings[field].setdefault(v, []).append(seq)
+        return seq
+
+    def _build_index(self):
+        # Single oldest-first pass over the segments at open
+        for seg_id in self._segments():
+            offset = 0
+            with open(self._segment_path(seg_id), "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except Exception:
+                        offset += len(line)
+                        continue
+                    self._index_entry(entry, (seg_id, offset, len(line)))
+                    offset += len(line)
+
+    def _open(self):
+        # Caller holds self._lock
+        if self._opened:
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        segs = self._segments()
+        if not segs:
+            self._import_legacy()
+            segs = self._segments()
+        self._segment_id = segs[-1] if segs else 1
+        path = self._segment_path(self._segment_id)
+        self._fh = open(path, "ab", buffering=0)
+        self._segment_size = os.path.getsize(path)
+        self._build_index()
+        self._appended_seq = self._written_seq = self._durable_seq = len(self._ts)
+        self.tail.extend(islice(self._iter_disk(), self.tail.maxlen))
+        self._writer = threading.Thread(target=self._writer_loop, name="action-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        self._opened = True
+
+    def _rotate(self):
+        fh = open(self._segment_path(self._segment_id + 1), "ab", buffering=0)
+        self._fh.close()
+        self._fh = fh
+        self._segment_id += 1
+        self._segment_size = 0
+
+    def _iter_disk(self):
+        # Newest first across all segments; torn or malformed lines are skipped
+        for seg_id in reversed(self._segments()):
+            try:
+                with open(self._segment_path(seg_id), "rb") as f:
+                    lines = f.readlines()
+            except OSError:
+                continue
+            for line in reversed(lines):
+                try:
+                    yield json.loads(line)
+                except Exception:
+                    continue
+
+    def _write_chunk(self, chunk: List[bytes], locs: List[Tuple[int, Tuple[int, int, int]]], done: List[Any]):
+        # The segment is unbuffered, so whatever write() accepted is in the file:
+        # an entry counts as committed once every byte of its line is
+        data = memoryview(b"".join(chunk))
+        written = 0
+        try:
+            while written < len(data):
+                written += self._fh.write(data[written:])
+        finally:
+            end = 0
+            for line, loc in zip(chunk, locs):
+                if end + len(line) > written:
+                    break
+                end += len(line)
+                done.append(loc)
+            self._segment_size += end
+            # Bytes of a partial line follow; the retry cuts them off first
+            self._torn = end < written
+
+    def _commit(self, batch: List[Tuple[int, bytes]], done: List[Tuple[int, Tuple[int, int, int]]]):
+        # One write + one fsync per segment touched by the batch; (seq, loc) of
+        # every entry that reached the file is appended to done, even on failure
+        if self._torn:
+            os.ftruncate(self._fh.fileno(), self._segment_size)
+            self._torn = False
+        chunk: List[bytes] = []
+        locs: List[Tuple[int, Tuple[int, int, int]]] = []
+        size = self._segment_size
+        for seq, line in batch:
+            if size and size + len(line) > self.segment_max_bytes:
+                if chunk:
+                    self._write_chunk(chunk, locs, done)
+                    chunk, locs = [], []
+                os.fsync(self._fh.fileno())
+                self._rotate()
+                size = 0
+            locs.append((seq, (self._segment_id, size, len(line))))
+            chunk.append(line)
+            size += len(line)
+        if chunk:
+            self._write_chunk(chunk, locs, done)
+        os.fsync(self._fh.fileno())
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._unsynced and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # Give a burst a short window to coalesce into the same commit
+                deadline = time.monotonic() + self.commit_window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+            done: List[Tuple[int, Tuple[int, int, int]]] = []
+            failed = False
+            try:
+                self._commit(batch, done)
+            except Exception:
+                failed = True
+            with self._cond:
+                for seq, loc in done:
+                    self._loc[seq - 1] = loc
+                    self._unwritten.pop(seq, None)
+                if done:
+                    self._written_seq = done[-1][0]
+                self.stats["entries_written"] += len(done)
+                if failed:
+                    # Re-queue only what never reached the file; a later commit
+                    # (or a bare fsync when nothing is left) makes the rest durable
+                    self.stats["write_errors"] += 1
+                    self._pending[:0] = batch[len(done):]
+                    self._unsynced = True
+                else:
+                    self._durable_seq = self._written_seq
+                    self._unsynced = False
+                    self.stats["commits"] += 1
+                self._cond.notify_all()
+            if failed:
+                time.sleep(0.5)
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        line = _encode(entry)
+        with self._cond:
+            self._open()
+            seq = self._index_entry(entry, None)
+            self._appended_seq = seq
+            self._pending.append((seq, line))
+            self._unwritten[seq] = entry
+            self.tail.appendleft(entry)
+            for fn in self._listeners:
+                try:
+                    fn(seq, entry)
+                except Exception:
+                    pass
+            self._cond.notify_all()
+            return seq
+
+    def last_seq(self) -> int:
+        # Changes on every append; a cheap version number for the whole log
+        with self._cond:
+            self._open()
+            return self._appended_seq
+
+    def add_listener(self, fn) -> int:
+        """
+        Call fn(seq, entry) for every entry appended from now on. Returns the
+        last seq already in the log, so callers can backfill up to it without
+        missing or double-counting entries.
+        """
+        with self._cond:
+            self._open()
+            self._listeners.append(fn)
+            return self._appended_seq
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # Block until every entry appended before this call is on disk
+        with self._cond:
+            if not self._opened:
+                return True
+            target = self._appended_seq
+            return self._cond.wait_for(lambda: self._durable_seq >= target, timeout)
+
+    async def await_durable(self, timeout: Optional[float] = None) -> bool:
+        return await asyncio.to_thread(self.flush, timeout)
+
+    def close(self):
+        with self._cond:
+            if not self._opened or self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._fh.close()
+
+    def read(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._open()
+            if limit is not None and limit <= len(self.tail):
+                return list(islice(self.tail, limit))
+        # Bounded: a writer that keeps failing must not hang readers. Entries
+        # still queued are served from memory ahead of the segments
+        if self.flush(LOG_READ_FLUSH_TIMEOUT_SECONDS):
+            return list(islice(self._iter_disk(), limit))
+        with self._lock:
+            queued = [self._unwritten[seq] for seq in sorted(self._unwritten, reverse=True)]
+        return list(islice(chain(queued, self._iter_disk()), limit))
+
+    def _locate(self, seqs: List[int]) -> List[Any]:
+        # Caller holds self._lock; each seq as its entry (tail ring or
+        # unwritten) or as the (segment, offset, length) to read it from
+        out: List[Any] = []
+        for seq in seqs:
+            pos = self._appended_seq - seq
+            if pos < len(self.tail):
+                out.append(self.tail[pos])
+            elif seq in self._unwritten:
+                out.append(self._unwritten[seq])
+            elif self._loc[seq - 1] is not None:
+                out.append(self._loc[seq - 1])
+        return out
+
+    def _fetch(self, located: List[Any]) -> List[Dict[str, Any]]:
+        # Without self._lock: segments are append-only, so the positioned reads
+        # stay valid while append() carries on
+        out = []
+        handles: Dict[int, Any] = {}
+        try:
+            for item in located:
+                if isinstance(item, dict):
+                    out.append(item)
+                    continue
+                seg_id, offset, length = item
+                try:
+                    if seg_id not in handles:
+                        handles[seg_id] = open(self._segment_path(seg_id), "rb")
+                    fh = handles[seg_id]
+                    fh.seek(offset)
+                    out.append(json.loads(fh.read(length)))
+                except Exception:
+                    continue
+        finally:
+            for fh in handles.values():
+                fh.close()
+        return out
+
+    def query(self, limit: int = 100, before: Optional[int] = None, since: Optional[str] = None,
+              **filters: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Newest-first page of entries with seq < before, timestamp >= since and
+        matching every given INDEX_FIELDS filter. Returns (entries, next_before)
+        where next_before is None once the log is exhausted.
+        """
+        active = {f: str(v) for f, v in filters.items() if v is not None}
+        unknown = set(active) - set(INDEX_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown filter: {', '.join(sorted(unknown))}")
+        with self._lock:
+            self._open()
+            upper = self._appended_seq if before is None else min(before - 1, self._appended_seq)
+            lower = 1
+            if since is not None:
+                lower = bisect.bisect_left(self._ts, normalize_since(since)) + 1
+            if active:
+                # Walk the shortest postings list and check the rest per seq
+                field, value = min(active.items(), key=lambda kv: len(self._postings[kv[0]].get(kv[1], ())))
+                posting = self._postings[field].get(value, [])
+                checks = [(INDEX_FIELDS.index(f), v) for f, v in active.items() if f != field]
+                candidates = (posting[i] for i in range(bisect.bisect_right(posting, upper) - 1, -1, -1))
+            else:
+                checks = []
+                candidates = iter(range(upper, 0, -1))
+            seqs: List[int] = []
+            for seq in candidates:
+                if seq < lower:
+                    break
+                values = self._values[seq - 1]
+                if all(values[i] == v for i, v in checks):
+                    seqs.append(seq)
+                    if len(seqs) > limit:
+                        break
+            more = len(seqs) > limit
+            seqs = seqs[:limit]
+            located = self._locate(seqs)
+        return self._fetch(located), (seqs[-1] if more else None)
+
+
+def _open_action_log():
+    # SegmentedLog under LOG_DIR, or an SQLiteLog, depending on STORAGE_BACKEND
+    from server.storage import get_backend
+    return get_backend().open_log()
+
+
+ACTION_LOG = _open_action_log()
+
+
+def read_logs(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    # Compatibility reader: same newest-first list the old action_log.json held
+    return ACTION_LOG.read(limit)
+
+
+def query_logs(limit: int = 100, cursor: Optional[str] = None, since: Optional[str] = None,
+               **filters: Optional[str]) -> Dict[str, Any]:
+    before = decode_cursor(cursor) if cursor else None
+    items, next_before = ACTION_LOG.query(limit=limit, before=before, since=since, **filters)
+    return {"items": items, "next_cursor": encode_cursor(next_before) if next_before else None}
+
+
+def flush_logs(timeout: Optional[float] = None) -> bool:
+    return ACTION_LOG.flush(timeout)
+
+
+async def await_logs_durable(timeout: Optional[float] = None) -> bool:
+    return await ACTION_LOG.await_durable(timeout)
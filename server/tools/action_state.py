@@ -0,0 +1,136 @@
+# server/tools/action_state.py
+import functools, inspect, threading, time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+from server.config import ACTION_STATE_TTL_SECONDS, ACTION_STATE_TTLS, ACTION_STATE_MAX_ENTRIES
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    # "stop_machine:600,update_order:120"
+    ttls: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, _, seconds = part.strip().partition(":")
+        if name and seconds:
+            ttls[name] = float(seconds)
+    return ttls
+
+
+class ActionStateCache:
+    """
+    Last effective action per (tool, target): the state it put the target
+    in, when, and the result it returned. A call that would put the target
+    in the state it is already in, within the tool's validity window, is
+    answered from here with already_applied=True. It does not run the tool,
+    so there is no log write and no downstream call. A different state
+    (e.g. another due time) or an expired entry runs the tool again. Only
+    successful results are recorded.
+    """
+    def __init__(self, ttl: float = ACTION_STATE_TTL_SECONDS, ttls: Optional[Dict[str, float]] = None,
+                 max_entries: int = ACTION_STATE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[Any, float, float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"applied": 0, "suppressed": 0, "expired": 0, "invalidated": 0}
+        self.by_tool: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, tool: str, what: str):
+        self.stats[what] += 1
+        counts = self.by_tool.setdefault(tool, {"applied": 0, "suppressed": 0})
+        if what in counts:
+            counts[what] += 1
+
+    def lookup(self, tool: str, target: Any, state: Any) -> Optional[Dict[str, Any]]:
+        # The "already applied" result for a repeat inside the window, else None
+        ttl = self.ttls.get(tool, self.ttl)
+        if ttl <= 0 or target is None:
+            return None
+        key = (tool, target)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            prev_state, at, wall, result = entry
+            if time.monotonic() - at > ttl:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                return None
+            if prev_state != state:
+                return None
+            self._count(tool, "suppressed")
+        return {**result, "already_applied": True,
+                "applied_at": datetime.fromtimestamp(wall, timezone.utc).replace(tzinfo=None).isoformat()}
+
+    def record(self, tool: str, target: Any, state: Any, result: Any):
+        if target is None or not isinstance(result, dict) or result.get("status") != "ok":
+            return
+        with self._lock:
+            self._count(tool, "applied")
+            if self.ttls.get(tool, self.ttl) <= 0:
+                return
+            key = (tool, target)
+            self._entries[key] = (state, time.monotonic(), time.time(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tool: str, target: Any) -> bool:
+        # For when the target's state is known to have changed (e.g. a machine restarted)
+        with self._lock:
+            if self._entries.pop((tool, target), None) is None:
+                return False
+            self.stats["invalidated"] += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "ttl_seconds": self.ttl, **self.stats,
+                    "by_tool": {tool: dict(c) for tool, c in self.by_tool.items()}}
+
+
+ACTION_STATE = ActionStateCache(ttls=parse_ttls(ACTION_STATE_TTLS))
+
+
+def idempotent(tool: str, target: str, state: Callable[[Dict[str, Any]], Any] = lambda args: None):
+    """
+    Decorate a tool so repeats go through ACTION_STATE. target names the
+    argument identifying the entity; state(args) is the state the call puts
+    it in (args include defaults). Works for sync and async tools.
+    """
+    def wrap(fn):
+        sig = inspect.signature(fn)
+
+        def _key(args, kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return bound.arguments.get(target), state(bound.arguments)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                tgt, st = _key(args, kwargs)
+                cached = ACTION_STATE.lookup(tool, tgt, st)
+                if cached is not None:
+                    return cached
+                result = await fn(*args, **kwargs)
+                ACTION_STATE.record(tool, tgt, st, result)
+                return result
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            tgt, st = _key(args, kwargs)
+            cached = ACTION_STATE.lookup(tool, tgt, st)
+            if cached is not None:
+                return cached
+            result = fn(*args, **kwargs)
+            ACTION_STATE.record(tool, tgt, st, result)
+            return result
+        return run
+    return wrap
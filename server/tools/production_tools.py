@@ -1,61 +1,45 @@
 # server/tools/production_tools.py
-import json, os, datetime, threading
-from server.config import DATA_DIR, LOG_FILE
+import datetime
+from server.tools.action_log import ACTION_LOG
+from server.tools.action_state import ACTION_STATE, idempotent
 
-_LOG_LOCK = threading.Lock()
-
-def _ensure_log():
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE,"w") as f:
-            json.dump([], f)
+# Machine statuses under which an earlier stop / maintenance is still in effect
+HALTED_STATUSES = ("stopped", "maintenance")
 
 def append_log(entry):
-    _ensure_log()
-    with _LOG_LOCK:
-        # Read existing logs safely
-        try:
-            with open(LOG_FILE, "r") as f:
-                logs = json.load(f)
-            if not isinstance(logs, list):
-                logs = []
-        except Exception:
-            logs = []
-        entry["timestamp"] = datetime.datetime.utcnow().isoformat()
-        logs.insert(0, entry)
-        # Atomic write via temp file then replace
-        tmp_path = LOG_FILE + ".tmp"
-        with open(tmp_path, "w") as f:
-            json.dump(logs, f, indent=2)
-        os.replace(tmp_path, LOG_FILE)
+    entry["timestamp"] = datetime.datetime.utcnow().isoformat()
+    ACTION_LOG.append(entry)
     # Best-effort realtime notification (optional, avoid hard dependency)
     try:
-        from server.realtime import notify_log
-        import asyncio
-        coro = notify_log(entry)
-        # If already in event loop, schedule; else run soon
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(coro)
-        except RuntimeError:
-            # No running loop; ignore
-            pass
+        from server.realtime import publish_log
+        # Queued for the next batched frame; a no-op outside the event loop
+        publish_log(entry)
     except Exception:
         # Realtime is optional; never break logging
         pass
 
+# Repeats on the same target inside the action-state window return "already applied" (see action_state.py)
+@idempotent("stop_machine", target="machine_id", state=lambda a: "stopped")
 def stop_machine(machine_id: str):
     append_log({"actor":"tool","action":"stop_machine","target":machine_id})
     return {"status":"ok","msg":f"Machine {machine_id} stopped."}
 
+@idempotent("schedule_maintenance", target="machine_id", state=lambda a: a["eta_hours"])
 def schedule_maintenance(machine_id: str, eta_hours:int=1):
     append_log({"actor":"tool","action":"schedule_maintenance","target":machine_id,"eta_hours":eta_hours})
     return {"status":"ok","msg":f"Maintenance scheduled for {machine_id}."}
 
+@idempotent("update_order", target="order_id", state=lambda a: a["new_due_in_hours"])
 def update_order_schedule(order_id: str, new_due_in_hours: float):
     append_log({"actor":"tool","action":"update_order","target":order_id,"new_due_in_hours": new_due_in_hours})
     return {"status":"ok","msg":f"Order {order_id} rescheduled."}
 
+def machine_status_changed(machine_id, old_status, new_status):
+    # A machine back out of stopped / maintenance needs its next stop and maintenance to run
+    if old_status in HALTED_STATUSES and new_status not in HALTED_STATUSES:
+        ACTION_STATE.invalidate("stop_machine", machine_id)
+        ACTION_STATE.invalidate("schedule_maintenance", machine_id)
+
 def log_event(event):
     append_log({"actor":"tool","action":"log","event":event})
     return {"status":"ok"}
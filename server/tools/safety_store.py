@@ -1,41 +1,109 @@
-import json
-import os
+import asyncio
 import threading
-from typing import List, Dict, Any
-from server.config import DATA_DIR
+from typing import List, Dict, Any, Iterable, Optional
+from server.repository import SAFETY_LOGS
+from server.config import SAFETY_RESOLVE_BATCH_MAX, SAFETY_RESOLVE_FLUSH_SECONDS
 
-SAFETY_LOG_FILE = os.path.join(DATA_DIR, "safety_logs.json")
+SAFETY_LOG_FILE = SAFETY_LOGS.path
 _LOCK = threading.Lock()
+# Unresolved log ids published by safety_log_loop whose event has not finished processing
+_IN_FLIGHT: set = set()
+# Resolutions applied in memory but not yet written to storage
+_PENDING: List[str] = []
+STATS = {"resolved": 0, "flushes": 0, "republish_skipped": 0}
 
 
 def load_safety_logs() -> List[Dict[str, Any]]:
-    if not os.path.exists(SAFETY_LOG_FILE):
-        return []
-    try:
-        with open(SAFETY_LOG_FILE, "r") as f:
-            data = json.load(f)
-            return data if isinstance(data, list) else []
-    except Exception:
-        return []
+    return SAFETY_LOGS.all()
 
 
 def save_safety_logs_atomic(logs: List[Dict[str, Any]]):
-    os.makedirs(DATA_DIR, exist_ok=True)
-    tmp = SAFETY_LOG_FILE + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(logs, f, indent=2)
-    os.replace(tmp, SAFETY_LOG_FILE)
+    with _LOCK:
+        _PENDING.clear()
+        SAFETY_LOGS.replace_all(logs)
+
+
+def claim(log_id: Any) -> bool:
+    # False when an event for this log is already queued or being processed
+    with _LOCK:
+        if log_id in _IN_FLIGHT:
+            STATS["republish_skipped"] += 1
+            return False
+        _IN_FLIGHT.add(log_id)
+        return True
+
+
+def release(log_id: Any):
+    with _LOCK:
+        _IN_FLIGHT.discard(log_id)
+
+
+def event_log_id(ev: Any) -> Optional[Any]:
+    # The safety log id a SafetyAgent event was raised for, else None
+    if not isinstance(ev, dict) or ev.get("source") != "SafetyAgent":
+        return None
+    payload = ev.get("payload")
+    return payload.get("id") if isinstance(payload, dict) else None
+
+
+def _resolve(log_id: Any) -> str:
+    # Caller holds _LOCK
+    item = SAFETY_LOGS.get(log_id)
+    if item is None:
+        return "not_found"
+    if item.get("status") == "resolved":
+        return "already_resolved"
+    # In memory now (readers and the state stream see it at once); written with the next flush
+    SAFETY_LOGS.update(log_id, {"status": "resolved"}, write=False)
+    _PENDING.append(log_id)
+    STATS["resolved"] += 1
+    return "resolved"
+
+
+def _flush() -> int:
+    # Caller holds _LOCK; one atomic write for every pending resolution
+    if not _PENDING:
+        return 0
+    n = len(_PENDING)
+    SAFETY_LOGS.flush()
+    _PENDING.clear()
+    STATS["flushes"] += 1
+    return n
 
 
 def mark_resolved(log_id: str) -> bool:
+    # O(1) lookup through the repository's id index; the write-back is batched
+    with _LOCK:
+        if _resolve(log_id) != "resolved":
+            return False
+        if len(_PENDING) >= SAFETY_RESOLVE_BATCH_MAX:
+            _flush()
+        return True
+
+
+def resolve_many(log_ids: Iterable[Any]) -> Dict[Any, str]:
+    # Resolve a batch and persist it with a single write; a status per id
+    with _LOCK:
+        results = {log_id: _resolve(log_id) for log_id in dict.fromkeys(log_ids)}
+        _flush()
+        return results
+
+
+def flush_resolutions() -> int:
+    with _LOCK:
+        return _flush()
+
+
+async def flush_loop(interval: float = SAFETY_RESOLVE_FLUSH_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            flush_resolutions()
+        except Exception:
+            # Pending resolutions stay queued for the next attempt
+            pass
+
+
+def snapshot() -> Dict[str, Any]:
     with _LOCK:
-        logs = load_safety_logs()
-        found = False
-        for item in logs:
-            if item.get("id") == log_id and item.get("status") != "resolved":
-                item["status"] = "resolved"
-                found = True
-                break
-        if found:
-            save_safety_logs_atomic(logs)
-        return found
+        return {"in_flight": len(_IN_FLIGHT), "pending_writes": len(_PENDING), **STATS}
@@ -0,0 +1,167 @@
+# server/triage_cache.py
+import copy, json, math, os, re, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from server.config import TRIAGE_CACHE_SIZE, TRIAGE_CACHE_TTL_SECONDS, TRIAGE_CACHE_FILE, TRIAGE_CACHE_BUCKETS
+
+# Fields that identify the entity an event is about; they are templated out of
+# cached decisions and filled back in from the event that hits the cache.
+ENTITY_FIELDS = ("id", "machine_id", "order_id", "operator_id")
+_PLACEHOLDER = re.compile(r"\{\{entity:(\w+)\}\}")
+
+
+def parse_buckets(spec: str) -> Dict[str, float]:
+    # "temperature:5,vibration:0.1,delay_percent:10"
+    buckets: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, _, step = part.strip().partition(":")
+        if name and step:
+            buckets[name] = float(step)
+    return buckets
+
+
+def _field(event: Dict[str, Any], name: str) -> Any:
+    payload = event.get("payload") if isinstance(event.get("payload"), dict) else {}
+    return payload.get(name, event.get(name))
+
+
+def _bucket(value: Any, step: float) -> Any:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    # round() first so 1.2 / 0.1 lands in bucket 12, not 11
+    return math.floor(round(value / step, 6)) * step
+
+
+def _entity_values(event: Dict[str, Any]) -> Dict[str, str]:
+    values = {}
+    for name in ENTITY_FIELDS:
+        v = _field(event, name)
+        if isinstance(v, (str, int)) and not isinstance(v, bool) and str(v):
+            values[name] = str(v)
+    return values
+
+
+def _template(obj: Any, entities: Dict[str, str]) -> Any:
+    if isinstance(obj, dict):
+        return {k: _template(v, entities) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_template(v, entities) for v in obj]
+    if isinstance(obj, str):
+        # Longest ids first so "M20" is not templated as "{{M2}}0"
+        for name, value in sorted(entities.items(), key=lambda kv: -len(kv[1])):
+            obj = re.sub(r"(?<![\w-])" + re.escape(value) + r"(?![\w-])", "{{entity:%s}}" % name, obj)
+        return obj
+    return obj
+
+
+def _fill(obj: Any, entities: Dict[str, str]) -> Any:
+    if isinstance(obj, dict):
+        return {k: _fill(v, entities) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_fill(v, entities) for v in obj]
+    if isinstance(obj, str) and "{{entity:" in obj:
+        return _PLACEHOLDER.sub(lambda m: entities.get(m.group(1), m.group(0)), obj)
+    return obj
+
+
+class TriageCache:
+    """
+    LRU + TTL cache of model triage decisions keyed by a canonical event
+    fingerprint: type, source and bucketed numeric fields. Entity ids are
+    stored as placeholders and substituted from the event on every hit, so
+    M7's cached decision stops M9 when M9 hits the same fingerprint.
+    """
+    def __init__(self, max_size: int = TRIAGE_CACHE_SIZE, ttl: float = TRIAGE_CACHE_TTL_SECONDS,
+                 buckets: Optional[Dict[str, float]] = None, path: str = TRIAGE_CACHE_FILE):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.buckets = buckets if buckets is not None else parse_buckets(TRIAGE_CACHE_BUCKETS)
+        self.path = path
+        self._items: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        if path:
+            self.load()
+
+    def fingerprint(self, event: Dict[str, Any]) -> str:
+        key = [event.get("type"), event.get("source")]
+        key += [[name, _bucket(_field(event, name), step)] for name, step in sorted(self.buckets.items())]
+        return json.dumps(key, default=str)
+
+    def get(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.max_size <= 0:
+            return None
+        fp = self.fingerprint(event)
+        now = time.time()
+        with self._lock:
+            item = self._items.get(fp)
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+            stored_at, decision = item
+            if now - stored_at > self.ttl:
+                del self._items[fp]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._items.move_to_end(fp)
+            self.stats["hits"] += 1
+        return _fill(copy.deepcopy(decision), _entity_values(event))
+
+    def put(self, event: Dict[str, Any], decision: Dict[str, Any]):
+        if self.max_size <= 0:
+            return
+        fp = self.fingerprint(event)
+        templ = _template(copy.deepcopy(decision), _entity_values(event))
+        with self._lock:
+            self._items[fp] = (time.time(), templ)
+            self._items.move_to_end(fp)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def load(self):
+        # Warm start from disk, skipping entries that already outlived the TTL
+        try:
+            with open(self.path) as f:
+                rows = json.load(f)
+        except Exception:
+            return
+        now = time.time()
+        with self._lock:
+            for row in rows if isinstance(rows, list) else []:
+                # One malformed row is skipped, never allowed to stop startup
+                try:
+                    fp, stored_at, decision = row
+                    if not isinstance(fp, str) or not isinstance(decision, dict):
+                        continue
+                    if now - float(stored_at) <= self.ttl:
+                        self._items[fp] = (float(stored_at), decision)
+                except Exception:
+                    continue
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            rows = [[fp, stored_at, decision] for fp, (stored_at, decision) in self._items.items()]
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(rows, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._items),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self.stats,
+        }
+
+
+TRIAGE_CACHE = TriageCache()